@@ -1,12 +1,13 @@
-from app import create_app, db
-from app.models import User, Post, Fishery, Fish
+from app import create_app, db, cli
+from app.models import User, Post, Fishery, Fish, Job
 
 app = create_app()
+cli.register(app)
 
 
 @app.shell_context_processor
 def make_shell_context():
-    return {'db': db, 'User': User, 'Post': Post, 'Fishery': Fishery, 'Fish': Fish}
+    return {'db': db, 'User': User, 'Post': Post, 'Fishery': Fishery, 'Fish': Fish, 'Job': Job}
 
 
 if __name__ == '__main__':
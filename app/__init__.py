@@ -1,16 +1,37 @@
-import os
-import logging
-from logging.handlers import RotatingFileHandler
+import sqlite3
 from flask import Flask
 from config import Config
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.identity import IdentityCache
+from app.jsonprovider import JSONProvider
+from app.logs import RequestLogging
+from app.fragments import FragmentCache
+from app.suggest import SuggestIndex
 
 db = SQLAlchemy()
 migrate = Migrate()
 login = LoginManager()
 login.login_view = 'auth.login'
+json_provider = JSONProvider()
+identity = IdentityCache()
+request_logging = RequestLogging()
+fragment_cache = FragmentCache()
+suggest_index = SuggestIndex()
+
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragma(dbapi_connection, connection_record):
+    """ WAL lets job workers and web processes share one SQLite file without blocking readers. """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA busy_timeout=5000')
+        cursor.close()
 
 
 def create_app(config_class=Config):
@@ -20,6 +41,14 @@ def create_app(config_class=Config):
     db.init_app(app)
     migrate.init_app(app, db)
     login.init_app(app)
+    json_provider.init_app(app)
+    identity.init_app(app)
+    request_logging.init_app(app)
+    fragment_cache.init_app(app)
+    suggest_index.init_app(app)
+
+    from app.sharding import shards
+    shards.init_app(app)
 
     from app.auth import bp as auth_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
@@ -30,22 +59,22 @@ def create_app(config_class=Config):
     from app.api import bp as api_bp
     app.register_blueprint(api_bp, url_prefix='/api')
 
+    from app.photos import bp as photos_bp
+    app.register_blueprint(photos_bp, url_prefix='/photos')
+
+    from app.health import bp as health_bp
+    app.register_blueprint(health_bp)
+
     from app.errors import bp as errors_bp
     app.register_blueprint(errors_bp)
 
+    if app.config['PRELOAD_TEMPLATES']:
+        fragment_cache.preload(app)
+
     if not app.debug and not app.testing:
-        if not os.path.exists('logs'):
-            os.mkdir('logs')
-        file_handler = RotatingFileHandler('logs/ang4us.log', maxBytes=10240, backupCount=10)
-        file_handler.setFormatter(logging.Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
-        file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
-
-        app.logger.setLevel(logging.INFO)
         app.logger.info('ang4us startup')
 
     return app
 
 
-from app import models
+from app import models, counters, changes, archive, sync
@@ -1,5 +1,6 @@
 from flask import g
 from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth
+from app import identity
 from app.models import User
 from app.api.errors import error_response
 
@@ -9,7 +10,7 @@ token_auth = HTTPTokenAuth()
 
 @basic_auth.verify_password
 def verify_password(username, password):
-    user = User.query.filter_by(username=username).first()
+    user = identity.get_by_username(username)
     if user is None:
         return False
     g.current_user = user
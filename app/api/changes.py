@@ -0,0 +1,110 @@
+import time
+from flask import Response, current_app, request, stream_with_context
+from app import db, json_provider
+from app.api import bp
+from app.api.auth import token_auth
+from app.api.errors import bad_request, error_response
+from app.changes import PUBLISHED, read
+from app.jsonprovider import jsonify
+
+
+def _claim_waiting():
+    """
+    Claim one of the CHANGES_MAX_WAITING workers which may hold a long poll or an event stream -
+    under the pre-forking server (app/server.py) each of them is a worker less for other requests.
+    :return: function which releases the claim, None when all are taken
+    """
+    shared = current_app.extensions.get('server_load')
+    if shared is None or shared.slot is None:
+        # flask run: a thread per request
+        return lambda: None
+    limit = current_app.config['CHANGES_MAX_WAITING']
+    if limit is None:
+        limit = shared.workers // 2
+    if sum(shared.waiting) >= limit:
+        return None
+    slot = shared.slot
+    shared.waiting[slot] = 1
+
+    def release():
+        shared.waiting[slot] = 0
+    return release
+
+
+def _poll(since, limit, entities, wait):
+    """
+    Events after `since`, waiting up to `wait` seconds for the first one.
+    The read transaction ends after every query, so a waiting consumer holds no connection.
+    :return: list of event dictionaries
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        items = [item.to_dict() for item in read(since, limit, entities)]
+        db.session.rollback()
+        if items or time.monotonic() >= deadline:
+            return items
+        time.sleep(min(current_app.config['CHANGES_POLL_INTERVAL'], max(deadline - time.monotonic(), 0)))
+
+
+def _event_stream(since, limit, entities):
+    """ Server-sent events: one 'changes' event per batch, its id is the last event id in it. """
+    config = current_app.config
+    yield f'retry: {int(config["CHANGES_POLL_INTERVAL"] * 1000)}\n\n'
+    # the stream ends after a while - it occupies a worker, the client reconnects with Last-Event-ID
+    deadline = time.monotonic() + config['CHANGES_STREAM_TIMEOUT']
+    while time.monotonic() < deadline:
+        items = _poll(since, limit, entities, config['CHANGES_MAX_WAIT'])
+        if items:
+            since = items[-1]['id']
+            yield f'id: {since}\nevent: changes\ndata: {json_provider.dumps(items).decode("utf-8")}\n\n'
+        else:
+            yield ': keep-alive\n\n'
+
+
+@bp.route('/changes', methods=['GET'])
+@token_auth.login_required
+def get_changes():
+    """
+    Change events after ?since= (or the Last-Event-ID header), oldest first.
+    ?wait= seconds to wait for new events (long poll), ?limit= batch size, ?entity= comma separated filter.
+    With 'Accept: text/event-stream' the events are streamed as server-sent events.
+    When too many consumers wait already a long poll returns at once and a stream is refused with 503.
+    """
+    config = current_app.config
+    since = request.args.get('since', type=int)
+    if since is None:
+        since = request.headers.get('Last-Event-ID', 0, type=int)
+    limit = max(min(request.args.get('limit', config['CHANGES_BATCH_SIZE'], type=int), config['CHANGES_MAX_BATCH']), 1)
+    wait = max(min(request.args.get('wait', 0, type=float), config['CHANGES_MAX_WAIT']), 0)
+    entities = [name for name in request.args.get('entity', '').split(',') if name]
+    unknown = set(entities) - set(PUBLISHED.values())
+    if unknown:
+        return bad_request(f'unknown entity: {", ".join(sorted(unknown))}')
+
+    stream = request.accept_mimetypes.best == 'text/event-stream'
+    release = _claim_waiting() if stream or wait else None
+    if stream:
+        if release is None:
+            response = error_response(503, 'too many event streams, poll instead')
+            response.headers['Retry-After'] = str(max(int(config['CHANGES_MAX_WAIT']), 1))
+            return response
+        response = Response(stream_with_context(_event_stream(since, limit, entities)),
+                            mimetype='text/event-stream')
+        response.call_on_close(release)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    if release is None:
+        # a plain poll - the consumer asks again, without holding a worker meanwhile
+        wait = 0
+    try:
+        items = _poll(since, limit, entities, wait)
+    finally:
+        if release is not None:
+            release()
+    return jsonify({
+        'items': items,
+        'next': items[-1]['id'] if items else since,
+        'more': len(items) == limit
+    })
@@ -0,0 +1,36 @@
+from flask import current_app, request
+from app import suggest_index
+from app.api import bp
+from app.api.auth import token_auth
+from app.api.errors import bad_request
+from app.api.resources import get_collection, get_item
+from app.jsonprovider import jsonify
+from app.models import Fish
+from app.suggest import KINDS
+
+
+@bp.route('/fish/<int:id>', methods=['GET'])
+@token_auth.login_required
+def get_fish(id):
+    return get_item(Fish, id)
+
+
+@bp.route('/fish', methods=['GET'])
+@token_auth.login_required
+def get_fish_list():
+    return get_collection(Fish, Fish.query, 'api.get_fish_list', filters=['species'])
+
+
+@bp.route('/fish/suggest', methods=['GET'])
+@token_auth.login_required
+def suggest_fish():
+    """ Species and fishery names starting with ?prefix= (case and accents ignored), from memory. """
+    kind = request.args.get('kind')
+    if kind is not None and kind not in KINDS:
+        return bad_request(f'kind must be one of: {", ".join(KINDS)}')
+    limit = max(min(request.args.get('limit', 10, type=int), current_app.config['SUGGEST_MAX_LIMIT']), 1)
+    # the index is kept up to date in the background - empty until the first load when not preloaded
+    suggest_index.start(current_app._get_current_object())
+    items = [{'name': name, 'kind': entry_kind, 'id': id}
+             for name, entry_kind, id in suggest_index.suggest(request.args.get('prefix', ''), limit, kind)]
+    return jsonify({'items': items})
@@ -0,0 +1,29 @@
+from app.api import bp
+from app.api.auth import token_auth
+from app.api.errors import bad_request, error_response
+from app.api.resources import collection_args, get_item
+from app.jsonprovider import jsonify
+from app.models import Fishery
+from app.sharding import shards
+
+
+@bp.route('/fisheries/<int:id>', methods=['GET'])
+@token_auth.login_required
+def get_fishery(id):
+    query = shards.find(id)
+    if query is None:
+        return error_response(404)
+    return get_item(Fishery, id, query)
+
+
+@bp.route('/fisheries', methods=['GET'])
+@token_auth.login_required
+def get_fisheries():
+    try:
+        args = collection_args(Fishery, filters=['country'])
+    except ValueError as e:
+        return bad_request(str(e))
+
+    return jsonify(shards.to_collection_dict(args['page'], args['per_page'], 'api.get_fisheries', args['order'],
+                                             fields=args['fields'], country=args['filters'].get('country'),
+                                             url_args=args['url_args']))
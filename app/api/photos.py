@@ -0,0 +1,46 @@
+from flask import g, request, url_for
+from app import db
+from app.api import bp
+from app.api.auth import token_auth
+from app.api.errors import bad_request, error_response
+from app.jobs import enqueue
+from app.models import Fish
+from app.photos.storage import ALLOWED_EXTENSIONS, extension, save, sniff
+from app.photos.tasks import make_thumbnail, thumbnails_enabled
+from app.jsonprovider import jsonify
+
+
+@bp.route('/photos', methods=['POST'])
+@token_auth.login_required
+def upload_photo():
+    upload = request.files.get('photo')
+    if upload is None or not upload.filename:
+        return bad_request('must include a photo file')
+    ext = extension(upload.filename)
+    if ext not in ALLOWED_EXTENSIONS:
+        return bad_request(f'allowed file types: {", ".join(sorted(ALLOWED_EXTENSIONS))}')
+    if sniff(upload.stream) != ext:
+        return bad_request(f'file is not a {ext} image')
+
+    fish = None
+    if 'fish_id' in request.form:
+        fish = Fish.query.get_or_404(request.form['fish_id'])
+        if fish.created_by != g.current_user.id:
+            return error_response(403, 'only the author of a fish can change its photo')
+
+    name, created = save(upload.stream, ext)
+    if created and thumbnails_enabled():
+        enqueue(make_thumbnail, key=f'thumb:{name}', name=name)
+    if fish is not None:
+        fish.photos = name
+    db.session.commit()
+
+    response = jsonify({
+        'name': name,
+        'duplicate': not created,
+        'url': url_for('photos.get_photo', name=name),
+        'thumbnail_url': url_for('photos.get_thumbnail', name=name)
+    })
+    response.status_code = 201 if created else 200
+    response.headers['Location'] = url_for('photos.get_photo', name=name)
+    return response
@@ -0,0 +1,63 @@
+from flask import request
+from app.api.errors import bad_request, error_response
+from app.jsonprovider import jsonify
+
+
+def collection_args(model, filters=()):
+    """
+    Parse the query string of a collection request.
+    :param model: ApiBaseModel with PaginatedApiMixin
+    :param filters: names of query string arguments compared with columns of the same name
+    :return: dict with page, per_page, fields, order, filters and url_args (repeated in the links)
+    :raise ValueError: for unknown fields or sort keys
+    """
+    args = {
+        'page': request.args.get('page', 1, type=int),
+        'per_page': min(request.args.get('per_page', 10, type=int), 100),
+        'fields': model.parse_fields(request.args.get('fields')),
+        'order': model.parse_sort(request.args.get('sort')),
+        'filters': {},
+        'url_args': {}
+    }
+    for name in filters:
+        value = request.args.get(name)
+        if value is not None:
+            args['filters'][name] = value
+            args['url_args'][name] = value
+    if 'sort' in request.args:
+        args['url_args']['sort'] = request.args['sort']
+    return args
+
+
+def get_collection(model, query, endpoint, filters=()):
+    """
+    Paginated listing with '?fields=', '?sort=' and equality filters on the given columns.
+    """
+    try:
+        args = collection_args(model, filters)
+    except ValueError as e:
+        return bad_request(str(e))
+
+    for name, value in args['filters'].items():
+        query = query.filter(model.__table__.c[name] == value)
+    query = query.order_by(*args['order'])
+    return jsonify(model.to_collection_dict(query, args['page'], args['per_page'], endpoint,
+                                            fields=args['fields'], url_args=args['url_args']))
+
+
+def get_item(model, id, query=None):
+    try:
+        fields = model.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return bad_request(str(e))
+
+    query = query if query is not None else model.query
+    if fields:
+        row = query.with_entities(*model.field_columns(fields)).filter(model.id == id).first()
+        if row is None:
+            return error_response(404)
+        return jsonify(model.row_to_dict(fields, row))
+    item = query.get(id)
+    if item is None:
+        return error_response(404)
+    return jsonify(item.to_dict())
@@ -0,0 +1,26 @@
+from flask import current_app, request
+from app.api import bp
+from app.api.auth import token_auth
+from app.api.errors import bad_request, error_response
+from app.jsonprovider import jsonify
+from app.sync import WatermarkExpired, page
+
+
+@bp.route('/sync', methods=['GET'])
+@token_auth.login_required
+def get_sync():
+    """
+    Users, fisheries, fish and posts changed since the client's watermark, plus ids of deleted ones.
+    Without ?cursor= a full sync starts; pass the cursor of every response to the next request
+    while 'more' is true. The cursor of the last page is the watermark for the next sync.
+    Rows are sent as {'fields': [...], 'rows': [[...], ...]} per entity, ?limit= rows per page.
+    """
+    config = current_app.config
+    limit = max(min(request.args.get('limit', config['SYNC_BATCH_SIZE'], type=int), config['SYNC_MAX_BATCH']), 1)
+    try:
+        data = page(request.args.get('cursor') or None, limit)
+    except ValueError as e:
+        return bad_request(str(e))
+    except WatermarkExpired:
+        return error_response(410, 'watermark is older than the change history, sync again without a cursor')
+    return jsonify(data)
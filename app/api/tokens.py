@@ -1,7 +1,8 @@
-from flask import jsonify, g
+from flask import g
 from app import db
 from app.api import bp
 from app.api.auth import basic_auth, token_auth
+from app.jsonprovider import jsonify
 
 
 @bp.route('/tokens', methods=['POST'])
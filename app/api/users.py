@@ -1,16 +1,34 @@
-from datetime import datetime
-from flask import jsonify, request, url_for
-from app import db
+from flask import request, url_for
+from app import db, identity
 from app.api import bp
 from app.models import User
 from app.api.auth import token_auth
 from app.api.errors import bad_request
+from app.auth.tasks import send_confirmation
+from app.jobs import enqueue
+from app.jsonprovider import jsonify
+
+# fields which ?show= may add to a user - everything else (email, ...) stays private
+SHOWABLE_FIELDS = ['post_count', 'fishery_count']
+
+
+def _show_fields():
+    """ :raise ValueError: for fields which are not in SHOWABLE_FIELDS """
+    show = [f for f in request.args.get('show', '').split(',') if f]
+    unknown = set(show) - set(SHOWABLE_FIELDS)
+    if unknown:
+        raise ValueError(f'unknown fields in show: {", ".join(sorted(unknown))}')
+    return show
 
 
 @bp.route('/users/<id>', methods=['GET'])
 @token_auth.login_required
 def get_user(id):
-    return jsonify(User.query.get_or_404(id).to_dict())
+    try:
+        show = _show_fields()
+    except ValueError as e:
+        return bad_request(str(e))
+    return jsonify(User.query.get_or_404(id).to_dict(show=show))
 
 
 @bp.route('/users', methods=['GET'])
@@ -18,7 +36,14 @@ def get_user(id):
 def get_users():
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
-    data = User.to_collection_dict(User.query, page, per_page, 'api.get_users')
+    try:
+        show = _show_fields()
+    except ValueError as e:
+        return bad_request(str(e))
+    # to_dict() takes a list, the links repeat the query string argument as it was given
+    kwargs = {'show': show, 'url_args': {'show': ','.join(show)}} if show else {}
+    data = User.to_collection_dict(User.query.order_by(User.created_at, User.id), page, per_page,
+                                   'api.get_users', **kwargs)
     return jsonify(data)
 
 
@@ -28,7 +53,7 @@ def create_user():
 
     if 'username' not in data or 'email' not in data or 'password' not in data:
         return bad_request('must include username, email and password fields')
-    if User.query.filter_by(username=data['username']).first():
+    if identity.get_by_username(data['username']):
         return bad_request('please use a different username')
     if User.query.filter_by(email=data['email']).first():
         return bad_request('please use a different email address')
@@ -36,6 +61,8 @@ def create_user():
     user = User()
     user.create_user(**data)
     db.session.add(user)
+    db.session.flush()
+    enqueue(send_confirmation, key=f'confirm:{user.id}', user_id=user.id)
     db.session.commit()
 
     response = jsonify(user.to_dict())
@@ -52,7 +79,7 @@ def update_user(id):
 
     if 'username' in data:
         new_username = data['username']
-        if new_username != user.username and User.query.filter_by(username=new_username).first():
+        if new_username != user.username and identity.get_by_username(new_username):
             return bad_request('please use a different username')
     if 'email' in data:
         new_email = data['email']
@@ -60,6 +87,5 @@ def update_user(id):
             return bad_request('please use a different email address')
 
     user.from_dict(**data)
-    user.modified_at = datetime.utcnow()
     db.session.commit()
     return jsonify(user.to_dict())
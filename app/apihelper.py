@@ -1,7 +1,8 @@
-from flask import json, url_for
+from flask import current_app, url_for
 from sqlalchemy.orm.attributes import QueryableAttribute
 from sqlalchemy.sql.expression import not_
 from app import db
+from app.jsonprovider import JSON_TYPES
 
 
 class PaginatedApiMixin:
@@ -11,21 +12,40 @@ class PaginatedApiMixin:
     Na podstawie podobnego rozwiązania z rozdziału 16
     Na razie wpisałem część funkcjonalności...
     """
-    @staticmethod
-    def to_collection_dict(query, page, per_page, endpoint, **kwargs):
+    @classmethod
+    def to_collection_dict(cls, query, page, per_page, endpoint, fields=None, url_args=None, **kwargs):
+        """
+        :param fields: column names (see ApiBaseModel.parse_fields) - only these columns are selected
+        :param url_args: query string arguments (filters, sort) repeated in the links
+        :param kwargs: passed to to_dict() and to the links
+        """
+        link_args = dict(kwargs, **(url_args or {}))
+        if fields:
+            query = query.with_entities(*cls.field_columns(fields))
+            link_args['fields'] = ','.join(fields)
         resources = query.paginate(page, per_page, error_out=False)
+        if fields:
+            items = [cls.row_to_dict(fields, row) for row in resources.items]
+        else:
+            items = [item.to_dict(**kwargs) for item in resources.items]
+        return cls.collection_dict(items, page, per_page, resources.total, endpoint, link_args)
+
+    @staticmethod
+    def collection_dict(items, page, per_page, total, endpoint, link_args):
+        """ Collection envelope for items which were already selected and serialized. """
+        pages = -(-total // per_page) if per_page else 0
         data = {
-            'items': [item.to_dict(**kwargs) for item in resources.items],
+            'items': items,
             'meta': {
                 'page': page,
                 'per_page': per_page,
-                'total_pages': resources.pages,
-                'total_items': resources.total
+                'total_pages': pages,
+                'total_items': total
             },
             'links': {
-                'self': url_for(endpoint, page=page, per_page=per_page, **kwargs),
-                'next': url_for(endpoint, page=page + 1, per_page=per_page, **kwargs) if resources.has_next else None,
-                'prev': url_for(endpoint, page=page - 1, per_page=per_page, **kwargs) if resources.has_prev else None
+                'self': url_for(endpoint, page=page, per_page=per_page, **link_args),
+                'next': url_for(endpoint, page=page + 1, per_page=per_page, **link_args) if page < pages else None,
+                'prev': url_for(endpoint, page=page - 1, per_page=per_page, **link_args) if page > 1 else None
             }
         }
         return data
@@ -41,6 +61,67 @@ class ApiBaseModel(db.Model):
     _default_fields = []
     _hidden_fields = []
     _readonly_fields = []
+    _volatile_fields = []       # changes of these fields are not published (app.changes)
+    _private_fields = []        # never in API responses or change events
+    _sortable_fields = ['id', 'created_at']
+    _item_endpoint = None
+
+    @classmethod
+    def parse_fields(cls, value):
+        """
+        Parse a '?fields=' sparse fieldset. 'id' is always included, 'links' needs no column.
+        :param value: comma separated column names
+        :return: list of field names, None when value is empty
+        :raise ValueError: for unknown, hidden or private fields
+        """
+        if not value:
+            return None
+        fields = ['id']
+        columns = cls.__table__.columns.keys()
+        for name in value.split(','):
+            name = name.strip()
+            if not name or name in fields:
+                continue
+            if name != 'links' and (name not in columns or name in cls._hidden_fields
+                                    or name in cls._private_fields or name.startswith('_')):
+                raise ValueError(f'unknown field: {name}')
+            fields.append(name)
+        return fields
+
+    @classmethod
+    def field_columns(cls, fields):
+        return [cls.__table__.c[name] for name in fields if name != 'links']
+
+    @classmethod
+    def row_to_dict(cls, fields, row):
+        """ Dictionary of a row selected with field_columns(). """
+        data = dict(zip([name for name in fields if name != 'links'], row))
+        if 'links' in fields and cls._item_endpoint:
+            data['links'] = {'self': url_for(cls._item_endpoint, id=data['id'])}
+        return data
+
+    @classmethod
+    def parse_sort(cls, value, default='created_at'):
+        """
+        Parse '?sort=' - comma separated '_sortable_fields', '-' prefix for descending order.
+        'id' is added as the last key, so paging is stable.
+        :return: list of ORDER BY expressions
+        :raise ValueError: for fields which can't be sorted on
+        """
+        order = []
+        for name in (value or default).split(','):
+            name = name.strip()
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            if name not in cls._sortable_fields:
+                raise ValueError(f"can't sort on: {name}")
+            column = cls.__table__.c[name]
+            order.append(column.desc() if descending else column)
+            if name == 'id':
+                return order
+        id_column = cls.__table__.c['id']
+        order.append(id_column.desc() if descending else id_column)
+        return order
 
     def to_dict(self, show=None, _hide=None, _path=None):
         """
@@ -53,12 +134,12 @@ class ApiBaseModel(db.Model):
         :return: dictionary with selected fields
         """
 
-        show = show or []
-        _hide = _hide or []
+        show = list(show or [])
+        _hide = list(_hide or [])
 
         hidden = self._hidden_fields if hasattr(self, '_hidden_fields') else []
-        default = self._default_fields if hasattr(self, '_default_fields') else []
-        default.extend(['id', 'modified_at', 'created_at', '_links'])
+        default = set(self._default_fields if hasattr(self, '_default_fields') else [])
+        default.update(['id', 'modified_at', 'created_at', '_links'])
 
         if not _path:
             _path = self.__tablename__.lower()
@@ -143,11 +224,14 @@ class ApiBaseModel(db.Model):
                     ret_data[key] = val.to_dict(show=list(show),
                                                 _hide=list(_hide),
                                                 _path=f'{_path}.{key.lower()}')
+                elif isinstance(val, JSON_TYPES):
+                    ret_data[key] = val
                 else:
                     try:
-                        ret_data[key] = json.loads(json.dumps(val))
-                    except:
-                        pass
+                        current_app.extensions['json_provider'].dumps(val)
+                    except TypeError:
+                        continue
+                    ret_data[key] = val
 
         return ret_data
 
@@ -0,0 +1,132 @@
+"""
+Archival tiering and cleanup of the hot tables.
+
+Posts older than POST_RETENTION_DAYS move from 'post' to 'post_archive'
+(the 'post_all' view reads both), expired API tokens are removed from the
+unique token index and change events older than CHANGES_RETENTION_DAYS
+are deleted. Work is done in batches of MAINTENANCE_BATCH_SIZE rows,
+one short transaction each, so requests are never blocked for long; the
+'maintenance.run' job does one round and schedules itself again.
+"""
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import literal, select
+from app import db, identity, changes
+from app.jobs import job, enqueue
+from app.models import Job, User, Post, PostArchive, POST_COLUMNS, post_all
+
+
+def archive_posts(batch_size):
+    """
+    Move one batch of old posts to the archive.
+    :return: number of moved posts
+    """
+    before = datetime.utcnow() - timedelta(days=current_app.config['POST_RETENTION_DAYS'])
+    # ids of archived posts are not reused - 'post' is AUTOINCREMENT
+    ids = [id for (id,) in db.session.query(Post.id)
+           .filter(Post.created_at < before)
+           .order_by(Post.created_at, Post.id)
+           .limit(batch_size)]
+    if not ids:
+        return 0
+    post, archive = Post.__table__, PostArchive.__table__
+    db.session.execute(archive.insert().from_select(
+        POST_COLUMNS + ['archived_at'],
+        select([post.c[name] for name in POST_COLUMNS] + [literal(datetime.utcnow())])
+        .where(post.c.id.in_(ids))))
+    # Core delete: post_count of the authors still includes archived posts
+    db.session.execute(post.delete().where(post.c.id.in_(ids)))
+    db.session.commit()
+    return len(ids)
+
+
+def expire_tokens(batch_size):
+    """
+    Clear one batch of expired API tokens.
+    :return: number of cleared tokens
+    """
+    ids = [id for (id,) in db.session.query(User.id)
+           .filter(User.token_expiration < datetime.utcnow())
+           .limit(batch_size)]
+    if not ids:
+        return 0
+    db.session.execute(User.__table__.update()
+                       .where(User.id.in_(ids))
+                       .values(token=None, token_expiration=None))
+    db.session.commit()
+    for user_id in ids:
+        identity.invalidate(user_id)
+    return len(ids)
+
+
+def run_batch():
+    """
+    One batch of every maintenance task.
+    :return: dict task -> number of rows
+    """
+    config = current_app.config
+    batch_size = config['MAINTENANCE_BATCH_SIZE']
+    return {
+        'posts archived': archive_posts(batch_size),
+        'tokens expired': expire_tokens(batch_size),
+        'change events pruned': changes.prune(
+            datetime.utcnow() - timedelta(days=config['CHANGES_RETENTION_DAYS']), batch_size),
+    }
+
+
+def run(pause=None, max_batches=None):
+    """
+    Run batches until nothing is left, sleeping `pause` seconds (default MAINTENANCE_PAUSE)
+    between them to leave the database to the requests.
+    :return: dict task -> total number of rows
+    """
+    pause = current_app.config['MAINTENANCE_PAUSE'] if pause is None else pause
+    batch_size = current_app.config['MAINTENANCE_BATCH_SIZE']
+    totals = {}
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        done = run_batch()
+        batches += 1
+        for task, count in done.items():
+            totals[task] = totals.get(task, 0) + count
+        if max(done.values()) < batch_size:
+            break
+        time.sleep(pause)
+    return totals
+
+
+def schedule(delay=0):
+    """ Enqueue the maintenance job unless one is already waiting. :return: Job """
+    waiting = Job.query.filter_by(name=run_job.job_name, status='queued').first()
+    if waiting is not None:
+        return waiting
+    return enqueue(run_job, delay=delay)
+
+
+@job('maintenance.run', max_attempts=1)
+def run_job():
+    """
+    A few batches per job, then the next run is scheduled: after MAINTENANCE_PAUSE when
+    there is more to do, after MAINTENANCE_INTERVAL when everything is done or the run failed.
+    """
+    config = current_app.config
+    delay = config['MAINTENANCE_INTERVAL']
+    try:
+        done = run(max_batches=config['MAINTENANCE_BATCHES_PER_JOB'])
+        current_app.logger.info('maintenance: %s', ', '.join(f'{count} {task}' for task, count in done.items()))
+        if max(done.values()) >= config['MAINTENANCE_BATCH_SIZE'] * config['MAINTENANCE_BATCHES_PER_JOB']:
+            delay = config['MAINTENANCE_PAUSE']
+    finally:
+        # also after an error ('database is locked') - the job is not retried, the next run must exist.
+        # Committed here, execute() rolls the session back when the job failed.
+        db.session.rollback()
+        schedule(delay)
+        db.session.commit()
+
+
+def user_posts(user_id):
+    """ Posts of a user from both tiers, newest first. """
+    return db.session.query(post_all) \
+        .filter(post_all.c.user_id == user_id) \
+        .order_by(post_all.c.created_at.desc(), post_all.c.id.desc())
@@ -1,9 +1,11 @@
 from flask import render_template, flash, redirect, url_for, request
 from flask_login import login_user, logout_user, current_user
 from werkzeug.urls import url_parse
-from app import db
+from app import db, identity
 from app.auth import bp
 from app.auth.forms import LoginForm, RegistrationForm
+from app.auth.tasks import send_confirmation, verify_confirmation_token
+from app.jobs import enqueue
 from app.models import User
 
 
@@ -14,7 +16,7 @@ def login():
 
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(username=form.username.data).first()
+        user = identity.get_by_username(form.username.data)
         if user is None or not user.check_password(form.password.data):
             flash('Invalid username or password')
             return redirect(url_for('auth.login'))
@@ -44,9 +46,24 @@ def register():
         user = User(username=form.username.data, email=form.email.data)
         user.set_password(form.password.data)
         db.session.add(user)
+        db.session.flush()
+        enqueue(send_confirmation, key=f'confirm:{user.id}', user_id=user.id)
         db.session.commit()
         flash('Congratulations, you are now a registered user!')
         return redirect(url_for('auth.login'))
 
     return render_template('auth/register.html', title='Register', form=form)
 
+
+@bp.route('/confirm/<token>')
+def confirm_email(token):
+    user = verify_confirmation_token(token)
+    if user is None:
+        flash('The confirmation link is invalid or has expired.')
+        return redirect(url_for('main.index'))
+
+    if not user.email_confirmed:
+        user.email_confirmed = True
+        db.session.commit()
+    flash('Your email address has been confirmed.')
+    return redirect(url_for('main.index'))
@@ -0,0 +1,36 @@
+from flask import current_app
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from app.jobs import job
+from app.models import User
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='email-confirm')
+
+
+def get_confirmation_token(user):
+    return _serializer().dumps({'id': user.id, 'email': user.email})
+
+
+def verify_confirmation_token(token, max_age=86400):
+    try:
+        data = _serializer().loads(token, max_age=max_age)
+    except BadSignature:
+        return None
+    user = User.query.get(data['id'])
+    if user is None or user.email != data['email']:
+        return None
+    return user
+
+
+@job('auth.send_confirmation')
+def send_confirmation(user_id):
+    """
+    Przygotowanie linku potwierdzającego adres email.
+    Brak skonfigurowanej wysyłki poczty - na razie link trafia do logu.
+    """
+    user = User.query.get(user_id)
+    if user is None or user.email_confirmed:
+        return
+    token = get_confirmation_token(user)
+    current_app.logger.info('Email confirmation for %s: /auth/confirm/%s', user.email, token)
@@ -0,0 +1,94 @@
+"""
+Batch processing of whole tables with flat memory use.
+
+Rows are read in id order, one chunk of `chunk_size` ids per query (WHERE id > last
+ORDER BY id LIMIT n), so no query result and no identity map grows with the table.
+iter_models() yields ORM instances and expunges each chunk from the session before
+the next one is read; iter_rows() skips the ORM and yields small __slots__ objects.
+"""
+from sqlalchemy import select
+from app import db
+
+_row_classes = {}
+
+
+def row_class(name, fields):
+    """ Class with __slots__ for the given fields - much smaller than a dict or an ORM instance. """
+    key = (name, tuple(fields))
+    cls = _row_classes.get(key)
+    if cls is None:
+        def __init__(self, *values):
+            for field, value in zip(self.__slots__, values):
+                setattr(self, field, value)
+
+        def __repr__(self):
+            return f'<{name} ' + ' '.join(f'{field}={getattr(self, field)!r}' for field in self.__slots__) + '>'
+
+        def as_dict(self):
+            return {field: getattr(self, field) for field in self.__slots__}
+
+        cls = type(name, (), {'__slots__': tuple(fields), '__init__': __init__, '__repr__': __repr__,
+                              'as_dict': as_dict})
+        _row_classes[key] = cls
+    return cls
+
+
+def iter_chunks(model, chunk_size=1000, query=None, session=None):
+    """
+    Lists of ORM instances in id order, at most chunk_size per list.
+    The instances of a chunk are expunged when the next one is requested - don't keep
+    them or modify them without committing first, changes of expunged objects are lost.
+    :param query: base query with filters, default model.query
+    """
+    session = session or db.session
+    query = query if query is not None else session.query(model)
+    last = None
+    while True:
+        chunk_query = query if last is None else query.filter(model.id > last)
+        chunk = chunk_query.order_by(model.id).limit(chunk_size).all()
+        if not chunk:
+            return
+        last = chunk[-1].id
+        yield chunk
+        for item in chunk:
+            if item in session:
+                session.expunge(item)
+        if len(chunk) < chunk_size:
+            return
+
+
+def iter_models(model, chunk_size=1000, query=None, session=None):
+    """ ORM instances one by one, see iter_chunks(). """
+    for chunk in iter_chunks(model, chunk_size, query, session):
+        yield from chunk
+
+
+def iter_rows(model, fields=None, chunk_size=1000, where=None, session=None):
+    """
+    Rows of a model's table as __slots__ objects, without the ORM.
+    :param fields: column names, default all columns except _hidden_fields
+    :param where: optional filter expression
+    """
+    session = session or db.session
+    table = model.__table__
+    if fields is None:
+        hidden = set(getattr(model, '_hidden_fields', []))
+        fields = [column.name for column in table.columns if column.name not in hidden]
+    cls = row_class(f'{model.__name__}Row', fields)
+    columns = [table.c[field] for field in fields]
+    id_column = table.c.id
+    last = None
+    while True:
+        statement = select(columns + [id_column.label('_last_id')])
+        if where is not None:
+            statement = statement.where(where)
+        if last is not None:
+            statement = statement.where(id_column > last)
+        rows = session.execute(statement.order_by(id_column).limit(chunk_size)).fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield cls(*row[:-1])
+        last = rows[-1][-1]
+        if len(rows) < chunk_size:
+            return
@@ -0,0 +1,458 @@
+"""
+Benchmarks run from the command line: `flask bench <name>`.
+Each benchmark works on a scratch SQLite database, never on the configured one.
+"""
+import gzip
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from config import Config
+
+
+@contextmanager
+def scratch_app(**config):
+    """ Application bound to a temporary SQLite file with all tables created. """
+    from app import create_app, db
+
+    fd, path = tempfile.mkstemp(suffix='.db', prefix='ang4us-bench-')
+    os.close(fd)
+    options = {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path, 'TESTING': True}
+    options.update(config)
+    bench_config = type('BenchConfig', (Config,), options)
+    app = create_app(bench_config)
+    try:
+        with app.app_context():
+            db.create_all()
+            yield app
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        os.remove(path)
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def rate(count, elapsed):
+    return count / elapsed if elapsed else float('inf')
+
+
+def bench_jobs(n=5000, batch=100):
+    """ Enqueue and claim/execute throughput of the job queue. """
+    from app import db
+    from app.jobs import job, enqueue, claim, execute
+
+    @job('bench.noop')
+    def noop(**kwargs):
+        pass
+
+    results = {}
+    with scratch_app(JOB_MAX_ATTEMPTS=1):
+        with Timer() as t:
+            for i in range(n):
+                enqueue('bench.noop', i=i)
+                db.session.commit()
+        results['enqueue, commit each'] = rate(n, t.elapsed)
+
+        with Timer() as t:
+            for i in range(n):
+                enqueue('bench.noop', key=f'bench:{i}', i=i)
+                if i % batch == batch - 1:
+                    db.session.commit()
+            db.session.commit()
+        results[f'enqueue with key, commit every {batch}'] = rate(n, t.elapsed)
+
+        done = 0
+        with Timer() as t:
+            while True:
+                item = claim('bench')
+                if item is None:
+                    break
+                execute(item)
+                done += 1
+        results['claim + execute'] = rate(done, t.elapsed)
+    return results
+
+
+def _insert_chunks(table, rows, chunk=10000):
+    from app import db
+
+    buffer = []
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) == chunk:
+            db.session.execute(table.insert(), buffer)
+            buffer = []
+    if buffer:
+        db.session.execute(table.insert(), buffer)
+    db.session.commit()
+
+
+def seed(rows):
+    """
+    Fill the scratch database: `rows` posts and rows/10 users, fisheries, fish and angler links.
+    """
+    from app.models import User, Post, Fishery, Fish, users_fisheries
+
+    rnd = random.Random(0)
+    users = max(rows // 10, 1)
+    start = datetime.utcnow() - timedelta(days=365)
+    countries = ['Poland', 'Germany', 'Sweden', 'Norway', 'Finland', 'Czechia', 'Slovakia', 'Austria']
+
+    def moment(i, n):
+        return start + timedelta(seconds=i * 365 * 86400 // n)
+
+    _insert_chunks(User.__table__, ({
+        'id': i, 'created_at': moment(i, users), 'username': f'angler{i}', 'email': f'angler{i}@example.com',
+        'token': f'token{i}', 'token_expiration': moment(i, users) + timedelta(hours=1)
+    } for i in range(1, users + 1)))
+    _insert_chunks(Post.__table__, ({
+        'id': i, 'created_at': moment(i, rows), 'body': f'Post #{i}', 'user_id': rnd.randint(1, users)
+    } for i in range(1, rows + 1)))
+    _insert_chunks(Fishery.__table__, ({
+        'id': i, 'created_at': moment(i, users), 'reservoir_name': f'Reservoir {i}',
+        'country': countries[i % len(countries)], 'created_by': rnd.randint(1, users)
+    } for i in range(1, users + 1)))
+    _insert_chunks(Fish.__table__, ({
+        'id': i, 'created_at': moment(i, users), 'species': f'species {i}', 'created_by': rnd.randint(1, users)
+    } for i in range(1, users + 1)))
+    _insert_chunks(users_fisheries, ({
+        'user_id': rnd.randint(1, users), 'fishery_id': rnd.randint(1, users)
+    } for _ in range(users)))
+
+
+def _time_queries(builders, repeat):
+    from app import db
+    from app.queryplan import _statement
+
+    timings = {}
+    for name, builder in builders:
+        statement = _statement(builder())
+        samples = []
+        for _ in range(repeat):
+            with Timer() as t:
+                db.session.execute(statement).fetchall()
+            samples.append(t.elapsed)
+        timings[name] = statistics.median(samples)
+    return timings
+
+
+def bench_indexes(rows=1000000, repeat=5):
+    """
+    Median latency of every known query with and without the hot path indexes.
+    :return: list of (name, seconds without indexes, seconds with indexes)
+    """
+    from app import db
+    from app.queryplan import KNOWN_QUERIES, HOT_PATH_INDEXES
+
+    with scratch_app():
+        seed(rows)
+        db.session.execute('ANALYZE')
+        after = _time_queries(KNOWN_QUERIES, repeat)
+        for name in HOT_PATH_INDEXES:
+            db.session.execute(f'DROP INDEX {name}')
+        db.session.commit()
+        before = _time_queries(KNOWN_QUERIES, repeat)
+    return [(name, before[name], after[name]) for name, _ in KNOWN_QUERIES]
+
+
+def bench_json(items=1000, repeat=20):
+    """
+    Serialization speed and response size of a users collection page.
+    :return: list of (encoder, MB/s, bytes, gzip bytes)
+    """
+    from flask import json
+    from app import db, json_provider, jsonprovider
+    from app.models import User
+
+    with scratch_app() as app:
+        users = [User(username=f'angler{i}', email=f'angler{i}@example.com', about_me='Pike and perch ' * 5)
+                 for i in range(items)]
+        db.session.add_all(users)
+        db.session.commit()
+        with app.test_request_context('/api/users'):
+            data = {'items': [user.to_dict() for user in users], 'meta': {'total_items': items}}
+            encoders = [
+                ('flask.json, indent=2', lambda d: json.dumps(d, indent=2).encode('utf-8')),
+                ('flask.json, compact', lambda d: json.dumps(d, separators=(',', ':')).encode('utf-8')),
+                ('JSONProvider' + (' (orjson)' if jsonprovider.orjson else ' (stdlib)'),
+                 json_provider.dumps)
+            ]
+            results = []
+            for name, dumps in encoders:
+                samples = []
+                for _ in range(repeat):
+                    with Timer() as t:
+                        body = dumps(data)
+                    samples.append(t.elapsed)
+                elapsed = statistics.median(samples)
+                results.append((name, len(body) / elapsed / 1e6, len(body), len(gzip.compress(body, 6))))
+    return results
+
+
+def bench_api(rows=10000, repeat=50, per_page=100):
+    """
+    Median latency of a fisheries page: full objects vs. a sparse fieldset.
+    :return: list of (url, milliseconds, response bytes)
+    """
+    from app import db
+    from app.models import User
+
+    with scratch_app() as app:
+        seed(rows * 10)
+        user = User.query.get(1)
+        token = user.get_token()
+        db.session.commit()
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+        urls = [
+            f'/api/fisheries?per_page={per_page}',
+            f'/api/fisheries?per_page={per_page}&fields=reservoir_name,country',
+            f'/api/fisheries?per_page={per_page}&country=Poland',
+            f'/api/fisheries?per_page={per_page}&country=Poland&fields=reservoir_name'
+        ]
+        results = []
+        for url in urls:
+            samples = []
+            for _ in range(repeat):
+                with Timer() as t:
+                    response = client.get(url, headers=headers)
+                samples.append(t.elapsed)
+            results.append((url, statistics.median(samples) * 1000, len(response.data)))
+    return results
+
+
+def _http_client(port, path, duration, counts):
+    import http.client
+
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    done = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        connection.request('GET', path)
+        connection.getresponse().read()
+        done += 1
+    connection.close()
+    counts.put(done)
+
+
+def bench_server(workers=(1, 2, 4), clients=None, duration=5.0, path='/auth/login'):
+    """
+    Requests per second of the pre-forking server for each number of workers,
+    with `clients` client processes (default: one per worker), one connection per request -
+    the server closes every connection after the response, keep-alive is not supported.
+    :return: list of (workers, requests/s)
+    """
+    import multiprocessing
+    import signal
+    import socket
+    from app.server import Arbiter
+
+    results = []
+    with scratch_app() as app:
+        for count in workers:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('127.0.0.1', 0))
+            sock.listen(app.config['SERVER_BACKLOG'])
+            port = sock.getsockname()[1]
+
+            pid = os.fork()
+            if not pid:
+                Arbiter(app, workers=count, sock=sock).run()
+                os._exit(0)
+            sock.close()
+
+            counts = multiprocessing.Queue()
+            processes = [multiprocessing.Process(target=_http_client, args=(port, path, duration, counts))
+                         for _ in range(clients or count)]
+            with Timer() as t:
+                for process in processes:
+                    process.start()
+                done = sum(counts.get() for _ in processes)
+                for process in processes:
+                    process.join()
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+            results.append((count, rate(done, t.elapsed)))
+    return results
+
+
+def bench_logging(n=20000):
+    """
+    Time spent in the logging call on the request thread. The queued records are
+    formatted by the writer thread meanwhile, on a single core it competes for the GIL.
+    :return: list of (handler, microseconds per record, records/s until written)
+    """
+    import logging
+    import shutil
+    from logging.handlers import RotatingFileHandler
+    from app.logs import file_listener
+
+    directory = tempfile.mkdtemp(prefix='ang4us-bench-logs-')
+    logger = logging.getLogger('ang4us.bench')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    results = []
+    try:
+        handler = logging.NullHandler()
+        logger.addHandler(handler)
+        with Timer() as t:
+            for i in range(n):
+                logger.info('record %d of %d', i, n, extra={'data': {'i': i}})
+        logger.removeHandler(handler)
+        results.append(('NullHandler (cost of the call itself)', t.elapsed / n * 1e6, rate(n, t.elapsed)))
+
+        handler = RotatingFileHandler(os.path.join(directory, 'rotating.log'), maxBytes=10240, backupCount=10)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
+        logger.addHandler(handler)
+        with Timer() as t:
+            for i in range(n):
+                logger.info('record %d of %d', i, n)
+        logger.removeHandler(handler)
+        handler.close()
+        results.append(('RotatingFileHandler, 10 kB files', t.elapsed / n * 1e6, rate(n, t.elapsed)))
+
+        config = {key: getattr(Config, key) for key in dir(Config) if key.startswith('LOG_')}
+        config.update(LOG_DIR=directory, LOG_QUEUE_SIZE=n + 1)
+        listener = file_listener(config)
+        listener.start()
+        logger.addHandler(listener.queue_handler)
+        with Timer() as t:
+            for i in range(n):
+                logger.info('record %d of %d', i, n, extra={'data': {'i': i}})
+        with Timer() as total:
+            listener.stop()
+        logger.removeHandler(listener.queue_handler)
+        results.append(('QueueHandler + batched JSON writer', t.elapsed / n * 1e6,
+                        rate(n, t.elapsed + total.elapsed)))
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def bench_render(posts=50, repeat=200):
+    """
+    Median time of the user page view with `posts` posts, without and with the fragment cache.
+    :return: list of (variant, milliseconds)
+    """
+    from flask_login import login_user
+    from app import db, fragment_cache
+    from app.models import User, Post
+
+    with scratch_app() as app:
+        user = User(username='angler', email='angler@example.com', about_me='Pike and perch')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add_all([Post(body=f'Post #{i} ' * 5, user_id=user.id) for i in range(posts)])
+        db.session.commit()
+        view = app.view_functions['main.user']
+
+        results = []
+        for name, enabled in (('no fragment cache', False), ('fragment cache, warm', True)):
+            fragment_cache.enabled = enabled
+            fragment_cache.clear()
+            samples = []
+            for _ in range(repeat + 1):
+                with app.test_request_context('/user/angler'):
+                    login_user(user)
+                    with Timer() as t:
+                        view('angler')
+                samples.append(t.elapsed)
+            # the first run fills the cache
+            results.append((name, statistics.median(samples[1:]) * 1000))
+        fragment_cache.enabled = app.config['FRAGMENT_CACHE_ENABLED']
+    return results
+
+
+def _peak_memory(f):
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        f()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_memory(sizes=(10000, 100000, 1000000), naive_limit=100000):
+    """
+    Peak Python memory (tracemalloc) of iterating all users, for every table size.
+    Batch iteration must stay flat; Query.all() is measured up to naive_limit rows for comparison.
+    :return: list of (rows, {method: peak bytes})
+    """
+    from app import db
+    from app.batching import iter_models, iter_rows
+    from app.models import User
+
+    def consume(items):
+        for item in items:
+            item.username
+
+    results = []
+    for size in sizes:
+        with scratch_app():
+            start = datetime.utcnow()
+            _insert_chunks(User.__table__, ({
+                'id': i, 'created_at': start, 'username': f'angler{i}', 'email': f'angler{i}@example.com',
+                'about_me': 'Pike and perch ' * 5
+            } for i in range(1, size + 1)))
+            db.session.remove()
+            peaks = {
+                'iter_models': _peak_memory(lambda: consume(iter_models(User))),
+                'iter_rows': _peak_memory(lambda: consume(iter_rows(User))),
+            }
+            if size <= naive_limit:
+                peaks['Query.all()'] = _peak_memory(lambda: consume(User.query.all()))
+            db.session.remove()
+        results.append((size, peaks))
+    return results
+
+
+def bench_suggest(names=100000, lookups=20000):
+    """
+    Build time, memory and lookup latency of the autocomplete index.
+    :return: dict measurement -> value
+    """
+    import tracemalloc
+    from app.suggest import SuggestIndex
+
+    rnd = random.Random(0)
+    syllables = ['ka', 'ra', 'sz', 'cz', 'pe', 'lo', 'wę', 'go', 'rz', 'sa', 'ła', 'mi', 'tr', 'ut', 'ok', 'oń']
+    entries = [('fish' if i % 2 else 'fishery', i,
+                ''.join(rnd.choice(syllables) for _ in range(rnd.randint(2, 6))).capitalize() + f' {i}')
+               for i in range(names)]
+    prefixes = [entry[2][:rnd.randint(1, 4)] for entry in rnd.sample(entries, min(lookups, names))]
+
+    with scratch_app():
+        index = SuggestIndex()
+        tracemalloc.start()
+        with Timer() as build:
+            index.build(entries)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        with Timer() as t:
+            for prefix in prefixes:
+                index.suggest(prefix, 10)
+        with Timer() as t_kind:
+            for prefix in prefixes:
+                index.suggest(prefix, 10, 'fishery')
+    return {
+        'names': len(index),
+        'build ms': build.elapsed * 1000,
+        'memory MB (tracemalloc)': memory / 1e6,
+        'memory MB (budget estimate)': index.memory / 1e6,
+        'lookup us': t.elapsed / len(prefixes) * 1e6,
+        'lookup one kind us': t_kind.elapsed / len(prefixes) * 1e6,
+    }
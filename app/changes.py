@@ -0,0 +1,114 @@
+"""
+Change data capture.
+Inserts, updates and deletes of published models are written to the 'change_event'
+outbox by mapper events, on the flush connection - in the same transaction as the
+change itself. Updates carry the same {field: {'old': ..., 'new': ...}} diff as
+from_dict(); hidden, private and volatile fields are never published. Fisheries stored in a
+shard are recorded through the main session, which ShardRouter.commit() commits
+right after the shard.
+Consumers read the outbox with /api/changes?since=<last seen id>.
+"""
+import json
+from datetime import datetime
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+from app import db
+from app.jsonprovider import default
+from app.models import ChangeEvent, User, Post, Fishery, Fish
+
+# model -> entity name in the events
+PUBLISHED = {
+    User: 'user',
+    Post: 'post',
+    Fishery: 'fishery',
+    Fish: 'fish'
+}
+
+
+def published_columns(mapper):
+    """ Column attributes which are published - changing one of them also stamps modified_at (app/sync.py). """
+    model = mapper.class_
+    excluded = set(getattr(model, '_hidden_fields', [])) | set(getattr(model, '_volatile_fields', [])) \
+        | set(getattr(model, '_private_fields', []))
+    return [column for column in mapper.column_attrs if column.key not in excluded]
+
+
+def _record(connection, target, op, changes):
+    session = object_session(target)
+    if session is not None and session.info.get('shard'):
+        # the outbox is in the main database (app/sharding.py)
+        connection = db.session.connection()
+    connection.execute(ChangeEvent.__table__.insert().values(
+        created_at=datetime.utcnow(),
+        entity=PUBLISHED[type(target)],
+        entity_id=target.id,
+        op=op,
+        changes=json.dumps(changes, separators=(',', ':'), default=default) if changes is not None else None))
+
+
+def _after_insert(mapper, connection, target):
+    changes = {}
+    for column in published_columns(mapper):
+        value = getattr(target, column.key)
+        if value is not None:
+            changes[column.key] = {'old': None, 'new': value}
+    _record(connection, target, 'insert', changes)
+
+
+def _after_update(mapper, connection, target):
+    state = inspect(target)
+    changes = {}
+    for column in published_columns(mapper):
+        history = state.attrs[column.key].history
+        if not history.has_changes():
+            continue
+        old = history.deleted[0] if history.deleted else None
+        new = history.added[0] if history.added else None
+        if old != new:
+            changes[column.key] = {'old': old, 'new': new}
+    # after_update also runs for objects without net changes, or only volatile ones
+    if changes:
+        _record(connection, target, 'update', changes)
+
+
+def _after_delete(mapper, connection, target):
+    _record(connection, target, 'delete', None)
+
+
+for model in PUBLISHED:
+    event.listen(model, 'after_insert', _after_insert)
+    event.listen(model, 'after_update', _after_update)
+    event.listen(model, 'after_delete', _after_delete)
+
+
+def read(since, limit, entities=None):
+    """
+    :param since: id of the last event the consumer has seen
+    :param limit: maximum number of events
+    :param entities: only events of these entity names
+    :return: list of ChangeEvent ordered by id
+    """
+    query = ChangeEvent.query.filter(ChangeEvent.id > since)
+    if entities:
+        query = query.filter(ChangeEvent.entity.in_(entities))
+    return query.order_by(ChangeEvent.id).limit(limit).all()
+
+
+def last_id():
+    return db.session.query(db.func.max(ChangeEvent.id)).scalar() or 0
+
+
+def prune(before, batch_size):
+    """
+    Delete one batch of events older than `before`.
+    :return: number of deleted events
+    """
+    ids = [id for (id,) in db.session.query(ChangeEvent.id)
+           .filter(ChangeEvent.created_at < before)
+           .order_by(ChangeEvent.created_at, ChangeEvent.id)
+           .limit(batch_size)]
+    if not ids:
+        return 0
+    db.session.execute(ChangeEvent.__table__.delete().where(ChangeEvent.id.in_(ids)))
+    db.session.commit()
+    return len(ids)
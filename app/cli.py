@@ -0,0 +1,206 @@
+import click
+from app import bench
+
+
+def register(app):
+    @app.cli.command()
+    @click.option('--bind', '-b', default=None, help='host:port (default SERVER_BIND).')
+    @click.option('--workers', '-w', type=int, default=None, help='Worker processes (default SERVER_WORKERS).')
+    def serve(bind, workers):
+        """Run the pre-forking production server."""
+        from app.server import Arbiter
+        Arbiter(app, bind, workers).run()
+
+    @app.cli.group()
+    def jobs():
+        """Background job queue commands."""
+        pass
+
+    @jobs.command()
+    @click.option('--processes', '-p', type=int, default=None,
+                  help='Number of worker processes (default JOB_WORKERS).')
+    @click.option('--burst', is_flag=True, help='Exit when the queue is empty.')
+    def worker(processes, burst):
+        """Run a pool of job worker processes."""
+        from app.jobs import run_workers
+        run_workers(app, processes, burst)
+
+    @app.cli.group()
+    def counters():
+        """Denormalized counter commands."""
+        pass
+
+    @counters.command()
+    @click.option('--batch-size', default=1000, help='Rows updated per transaction.')
+    def reconcile(batch_size):
+        """Recompute post, fishery and angler counters."""
+        from app.counters import reconcile as reconcile_counters
+        for table, count in reconcile_counters(batch_size).items():
+            click.echo(f'{table}: {count} rows')
+
+    @app.cli.group()
+    def shards():
+        """Fishery shard commands."""
+        pass
+
+    @shards.command()
+    def init():
+        """Create fishery tables in every shard and the id sequence."""
+        from app.sharding import shards as router
+        router.create_all()
+        click.echo(f'Shards ready: {", ".join(name or "main" for name in router.names)}')
+
+    @shards.command()
+    @click.option('--batch-size', default=500, help='Fisheries moved per transaction.')
+    def rebalance(batch_size):
+        """Move fisheries to the shard of their country."""
+        from app.sharding import shards as router
+        moved = router.rebalance(batch_size)
+        for (source, target), count in moved.items():
+            click.echo(f'{source or "main"} -> {target or "main"}: {count}')
+        if not moved:
+            click.echo('All fisheries are in their shards.')
+
+    @app.cli.group()
+    def queryplan():
+        """Query plan checks."""
+        pass
+
+    @queryplan.command()
+    @click.option('--verbose', '-v', is_flag=True, help='Print every plan.')
+    def check(verbose):
+        """Fail if a known query scans a whole table."""
+        from app.queryplan import check as check_plans
+        failed = 0
+        for name, plan, problems in check_plans():
+            if problems:
+                failed += 1
+            if problems or verbose:
+                click.echo(f'{"FAIL" if problems else "ok":4} {name}')
+                for line in plan:
+                    click.echo(f'       {line}')
+        if failed:
+            raise click.ClickException(f'{failed} queries without a usable index')
+        click.echo('All known queries use indexes.')
+
+    @app.cli.group()
+    def users():
+        """User data commands."""
+        pass
+
+    @users.command('export')
+    @click.option('--output', '-o', type=click.File('wb'), default='-', help='File name, default stdout.')
+    def users_export(output):
+        """Export all users as JSON lines (hidden fields left out)."""
+        from app import json_provider
+        from app.batching import iter_rows
+        from app.models import User
+        for row in iter_rows(User):
+            output.write(json_provider.dumps(row.as_dict()) + b'\n')
+
+    @app.cli.group()
+    def maintenance():
+        """Archival and cleanup of the hot tables."""
+        pass
+
+    @maintenance.command('run')
+    @click.option('--pause', type=float, default=None, help='Seconds between batches (default MAINTENANCE_PAUSE).')
+    def maintenance_run(pause):
+        """Archive old posts and clear expired tokens now, batch by batch."""
+        from app.archive import run
+        for task, count in run(pause).items():
+            click.echo(f'{task}: {count}')
+
+    @maintenance.command('schedule')
+    def maintenance_schedule():
+        """Start the self-rescheduling maintenance job (needs `flask jobs worker`)."""
+        from app import db
+        from app.archive import schedule
+        item = schedule()
+        db.session.commit()
+        click.echo(f'maintenance job {item.id} queued for {item.run_at}')
+
+    @app.cli.group('bench')
+    def bench_group():
+        """Performance benchmarks on a scratch database."""
+        pass
+
+    @bench_group.command('jobs')
+    @click.option('--n', default=5000, help='Number of jobs.')
+    def bench_jobs(n):
+        """Job queue enqueue/dequeue throughput."""
+        for name, value in bench.bench_jobs(n).items():
+            click.echo(f'{name:40} {value:12.0f} jobs/s')
+
+    @bench_group.command('indexes')
+    @click.option('--rows', default=1000000, help='Number of posts (other tables get rows/10).')
+    @click.option('--repeat', default=5, help='Runs per query, the median is reported.')
+    def bench_indexes(rows, repeat):
+        """Known query latency before/after the hot path indexes."""
+        click.echo(f'{"query":24} {"before ms":>12} {"after ms":>12} {"speedup":>9}')
+        for name, before, after in bench.bench_indexes(rows, repeat):
+            click.echo(f'{name:24} {before * 1000:12.3f} {after * 1000:12.3f} {before / after:8.1f}x')
+
+    @bench_group.command('json')
+    @click.option('--items', default=1000, help='Users in the serialized collection.')
+    def bench_json(items):
+        """API JSON encoder throughput and response size."""
+        click.echo(f'{"encoder":32} {"MB/s":>8} {"bytes":>10} {"gzip":>10}')
+        for name, speed, size, compressed in bench.bench_json(items):
+            click.echo(f'{name:32} {speed:8.1f} {size:10} {compressed:10}')
+
+    @bench_group.command('api')
+    @click.option('--rows', default=10000, help='Number of fisheries.')
+    @click.option('--per-page', default=100, help='Page size.')
+    def bench_api(rows, per_page):
+        """Fisheries API latency with and without sparse fieldsets."""
+        for url, ms, size in bench.bench_api(rows, per_page=per_page):
+            click.echo(f'{url:70} {ms:8.2f} ms {size:8} bytes')
+
+    @bench_group.command('server')
+    @click.option('--workers', '-w', default='1,2,4', help='Comma separated worker counts to compare.')
+    @click.option('--clients', '-c', type=int, default=None,
+                  help='Concurrent client processes (default: one per worker).')
+    @click.option('--duration', '-d', default=5.0, help='Seconds per run.')
+    def bench_server(workers, clients, duration):
+        """Requests per second of the production server."""
+        counts = [int(count) for count in workers.split(',')]
+        click.echo('one connection per request - the sync workers do not support keep-alive')
+        for count, value in bench.bench_server(counts, clients, duration):
+            click.echo(f'{count:3} workers {value:10.0f} requests/s')
+
+    @bench_group.command('logging')
+    @click.option('--n', default=20000, help='Number of log records.')
+    def bench_logging(n):
+        """Logging overhead on the request thread."""
+        click.echo(f'{"handler":38} {"us/record":>10} {"records/s":>12}')
+        for name, micros, value in bench.bench_logging(n):
+            click.echo(f'{name:38} {micros:10.2f} {value:12.0f}')
+
+    @bench_group.command('render')
+    @click.option('--posts', default=50, help='Posts on the user page.')
+    def bench_render(posts):
+        """User page render time with and without the fragment cache."""
+        for name, ms in bench.bench_render(posts):
+            click.echo(f'{name:24} {ms:8.3f} ms')
+
+    @bench_group.command('memory')
+    @click.option('--sizes', default='10000,100000,1000000', help='Comma separated numbers of users.')
+    @click.option('--tolerance', default=2.0, help='Allowed growth of the peak from the smallest size.')
+    def bench_memory(sizes, tolerance):
+        """Peak memory of batch iteration; fails unless it stays flat."""
+        counts = [int(size) for size in sizes.split(',')]
+        results = bench.bench_memory(counts)
+        for size, peaks in results:
+            click.echo(f'{size:>9} rows  ' + '  '.join(f'{name} {peak / 1024:9.0f} kB' for name, peak in peaks.items()))
+        for method in ('iter_models', 'iter_rows'):
+            first, last = results[0][1][method], results[-1][1][method]
+            if last > first * tolerance:
+                raise click.ClickException(f'{method}: peak grew from {first} to {last} bytes')
+
+    @bench_group.command('suggest')
+    @click.option('--names', default=100000, help='Names in the index.')
+    def bench_suggest(names):
+        """Autocomplete index build time, memory and lookup latency."""
+        for name, value in bench.bench_suggest(names).items():
+            click.echo(f'{name:28} {value:12.2f}')
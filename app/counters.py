@@ -0,0 +1,109 @@
+"""
+Denormalized aggregates: User.post_count, User.fishery_count and Fishery.user_count.
+Post and Fishery rows keep the counters of their authors up to date in the same
+transaction (mapper events run on the flush connection), reconcile() recomputes
+everything in bulk. Fisheries stored in a shard update the counters through the
+main session, which ShardRouter.commit() commits after the shard. A counter change
+stamps modified_at of its row, so delta sync (app/sync.py) sends the new value.
+"""
+from datetime import datetime
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import get_history
+from app import db
+from app.models import User, Post, Fishery, users_fisheries, post_all
+from app.sharding import MAIN, shards
+
+# model -> (foreign key attribute, counter column on User)
+TRACKED = {
+    Post: ('user_id', User.post_count),
+    Fishery: ('created_by', User.fishery_count)
+}
+
+
+def _bump(connection, counter, user_id, delta, target=None):
+    if user_id is None:
+        return
+    session = object_session(target) if target is not None else None
+    if session is not None and session.info.get('shard'):
+        # fishery stored in a shard (app/sharding.py) - users live in the main database
+        connection = db.session.connection()
+    connection.execute(User.__table__.update()
+                       .where(User.id == user_id)
+                       .values({counter: counter + delta, User.modified_at: datetime.utcnow()}))
+
+
+def _after_insert(mapper, connection, target):
+    key, counter = TRACKED[mapper.class_]
+    _bump(connection, counter, getattr(target, key), 1, target)
+
+
+def _after_delete(mapper, connection, target):
+    key, counter = TRACKED[mapper.class_]
+    _bump(connection, counter, getattr(target, key), -1, target)
+
+
+def _before_update(mapper, connection, target):
+    key, counter = TRACKED[mapper.class_]
+    history = get_history(target, key)
+    if not history.has_changes():
+        return
+    old_values = history.deleted
+    if not old_values:
+        # the attribute was expired when it was set - the row still has the old value
+        column = mapper.columns[key]
+        old_values = [connection.execute(select([column])
+                                         .where(mapper.primary_key[0] == target.id)).scalar()]
+    for old in old_values:
+        _bump(connection, counter, old, -1, target)
+    for new in history.added:
+        _bump(connection, counter, new, 1, target)
+
+
+for model in TRACKED:
+    event.listen(model, 'after_insert', _after_insert)
+    event.listen(model, 'after_delete', _after_delete)
+    event.listen(model, 'before_update', _before_update)
+
+
+def reconcile(batch_size=1000):
+    """
+    Recompute all counters with correlated subqueries, one id range per transaction.
+    Fisheries in shards are counted per shard and added to fishery_count; user_count
+    is recomputed in every shard, next to its 'users_fisheries' links.
+    :return: number of updated rows per table
+    """
+    # archived posts are still counted
+    post_count = select([func.count(post_all.c.id)]).where(post_all.c.user_id == User.id).as_scalar()
+    fishery_count = select([func.count(Fishery.id)]).where(Fishery.created_by == User.id).as_scalar()
+    user_count = select([func.count()]).select_from(users_fisheries) \
+        .where(users_fisheries.c.fishery_id == Fishery.id).as_scalar()
+    other_shards = [session for name, session in shards.sessions() if name is not MAIN]
+
+    updated = {'user': 0, 'fishery': 0}
+    max_id = db.session.query(func.max(User.id)).scalar() or 0
+    for start in range(0, max_id, batch_size):
+        in_range = db.and_(User.id > start, User.id <= start + batch_size)
+        result = db.session.execute(User.__table__.update()
+                                    .where(in_range)
+                                    .values({'post_count': post_count, 'fishery_count': fishery_count}))
+        for session in other_shards:
+            for user_id, count in session.query(Fishery.created_by, func.count(Fishery.id)) \
+                    .filter(Fishery.created_by > start, Fishery.created_by <= start + batch_size) \
+                    .group_by(Fishery.created_by):
+                db.session.execute(User.__table__.update()
+                                   .where(User.id == user_id)
+                                   .values(fishery_count=User.fishery_count + count))
+        db.session.commit()
+        updated['user'] += result.rowcount
+
+    for name, session in shards.sessions():
+        max_id = session.query(func.max(Fishery.id)).scalar() or 0
+        for start in range(0, max_id, batch_size):
+            result = session.execute(Fishery.__table__.update()
+                                     .where(Fishery.id > start)
+                                     .where(Fishery.id <= start + batch_size)
+                                     .values({'user_count': user_count}))
+            session.commit()
+            updated['fishery'] += result.rowcount
+    return updated
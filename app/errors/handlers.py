@@ -1,4 +1,5 @@
-from flask import render_template, request
+from flask import make_response, render_template, request
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from app import db
 from app.errors import bp
 from app.api.errors import error_response as api_error_response
@@ -21,3 +22,16 @@ def internal_error(error):
     if wants_json_response():
         return api_error_response(500)
     return render_template('errors/500.html'), 500
+
+
+@bp.app_errorhandler(PoolTimeoutError)
+def pool_timeout_error(error):
+    """ No database connection became free in time - the worker is overloaded, not broken. """
+    db.session.rollback()
+    if wants_json_response():
+        response = api_error_response(503, 'The server is busy, please retry.')
+    else:
+        response = render_template('errors/503.html'), 503
+    response = make_response(response)
+    response.headers['Retry-After'] = '1'
+    return response
@@ -0,0 +1,151 @@
+"""
+Template fragment cache.
+
+    {% cache user, user.post_count %} ... {% endcache %}
+
+renders the block once per key and reuses the HTML. Models in the key stand for
+(table, id, modified_at or created_at), so editing a row changes its key; values
+read from other rows must be part of the key themselves.
+Never cache markup which depends on the viewer (current_user, forms, flashes).
+
+Fragments are kept in a per-process LRU of FRAGMENT_CACHE_SIZE entries and, when
+FRAGMENT_CACHE_DIR is set, in files shared by all processes for FRAGMENT_CACHE_TTL
+seconds. All templates are compiled at startup, before the server forks.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+def fragment_key(value):
+    """ Hashable key part of a template value. """
+    if hasattr(value, '__table__') and hasattr(value, 'id'):
+        version = getattr(value, 'modified_at', None) or getattr(value, 'created_at', None)
+        return value.__table__.name, value.id, version.isoformat() if version else None
+    if isinstance(value, (list, tuple)):
+        return tuple(fragment_key(item) for item in value)
+    return value
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        # the block's position is part of the key, so equal keys in other blocks don't collide
+        args = [nodes.Const(f'{parser.name}:{lineno}')]
+        while parser.stream.current.type != 'block_end':
+            if len(args) > 1:
+                parser.stream.expect('comma')
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(args)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        cache = self.environment.fragment_cache
+        if not cache.enabled:
+            return caller()
+        key = repr(tuple(fragment_key(part) for part in key))
+        html = cache.get(key)
+        if html is None:
+            html = caller()
+            cache.set(key, html)
+        return Markup(html)
+
+
+class FragmentCache:
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._local = OrderedDict()
+        self.enabled = True
+        self.maxsize = 2048
+        self.directory = None
+        self.ttl = 3600
+        self.hits = self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('FRAGMENT_CACHE_ENABLED', self.enabled)
+        self.maxsize = app.config.get('FRAGMENT_CACHE_SIZE', self.maxsize)
+        self.directory = app.config.get('FRAGMENT_CACHE_DIR', self.directory)
+        self.ttl = app.config.get('FRAGMENT_CACHE_TTL', self.ttl)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self
+        app.extensions['fragment_cache'] = self
+
+    @staticmethod
+    def preload(app):
+        """ Compile every template now, so requests (and forked workers) find them in Jinja's cache. """
+        env = app.jinja_env
+        if env.cache is not None and env.cache.capacity < len(env.list_templates()):
+            app.logger.warning('Jinja cache (%d) is smaller than the number of templates', env.cache.capacity)
+        for name in env.list_templates():
+            env.get_template(name)
+
+    def get(self, key):
+        with self._lock:
+            html = self._local.get(key)
+            if html is not None:
+                self._local.move_to_end(key)
+                self.hits += 1
+                return html
+        html = self._read_shared(key)
+        if html is not None:
+            self._store_local(key, html)
+            self.hits += 1
+            return html
+        self.misses += 1
+        return None
+
+    def set(self, key, html):
+        self._store_local(key, html)
+        self._write_shared(key, html)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        if self.directory:
+            for name in os.listdir(self.directory):
+                if name.endswith('.html'):
+                    os.remove(os.path.join(self.directory, name))
+
+    def _store_local(self, key, html):
+        with self._lock:
+            self._local[key] = html
+            self._local.move_to_end(key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.html')
+
+    def _read_shared(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) < time.time() - self.ttl:
+                os.remove(path)
+                return None
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_shared(self, key, html):
+        if not self.directory:
+            return
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(html)
+        # readers see the whole file or none
+        os.replace(temporary, self._path(key))
@@ -0,0 +1,115 @@
+"""
+Load of the server: requests in flight, the accept backlog, connection pool usage
+and a cached database probe. Under the pre-forking server (app/server.py) requests
+in flight and the backlog are those of all workers, read from shared memory - any
+idle worker can report that the others are saturated. Elsewhere (flask run) the
+requests in flight of this process are counted.
+"""
+import threading
+import time
+from flask import current_app, g
+from sqlalchemy import text
+
+
+class LoadMonitor:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self._probe = None          # (checked at, result)
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+        g.counted_in_flight = True
+
+    def request_finished(self):
+        if g.pop('counted_in_flight', False):
+            with self._lock:
+                self.in_flight -= 1
+
+    def probe(self):
+        """
+        Check out a connection and run SELECT 1, at most once per HEALTH_PROBE_TTL seconds.
+        :return: dict with 'ok', 'pool_wait_ms', 'query_ms' and 'error'
+        """
+        from app import db
+
+        now = time.monotonic()
+        probe = self._probe
+        if probe is not None and now - probe[0] < current_app.config['HEALTH_PROBE_TTL']:
+            return probe[1]
+
+        result = {'ok': True, 'pool_wait_ms': None, 'query_ms': None, 'error': None}
+        start = time.perf_counter()
+        try:
+            with db.engine.connect() as connection:
+                connected = time.perf_counter()
+                connection.execute(text('SELECT 1')).scalar()
+                result['pool_wait_ms'] = round((connected - start) * 1000, 3)
+                result['query_ms'] = round((time.perf_counter() - connected) * 1000, 3)
+        except Exception as e:
+            result.update(ok=False, error=f'{e.__class__.__name__}: {e}')
+        self._probe = (time.monotonic(), result)
+        return result
+
+    @staticmethod
+    def pool():
+        """ Pool statistics; pools without a fixed size (SQLite) only report checked out connections. """
+        from app import db
+
+        pool = db.engine.pool
+        stats = {'class': pool.__class__.__name__}
+        for name in ('size', 'checkedout', 'overflow'):
+            method = getattr(pool, name, None)
+            if method is not None:
+                stats[name] = method()
+        max_overflow = getattr(pool, '_max_overflow', None)
+        if 'size' in stats and max_overflow is not None and max_overflow >= 0:
+            stats['limit'] = stats['size'] + max_overflow
+        return stats
+
+    def status(self, ready):
+        """
+        :param ready: also apply the load thresholds (readiness), not only connectivity
+        :return: tuple (healthy, body)
+        """
+        config = current_app.config
+        pool = self.pool()
+        exhausted = 'limit' in pool and pool['checkedout'] >= pool['limit']
+        # don't wait for a connection (up to the pool timeout) when there is none to get
+        database = self._probe[1] if exhausted and self._probe is not None else self.probe()
+        shared = current_app.extensions.get('server_load')
+        # the health request itself is not load
+        if shared is not None:
+            in_flight, backlog = max(shared.in_flight() - 1, 0), shared.backlog()
+        else:
+            in_flight, backlog = max(self.in_flight - 1, 0), None
+        max_in_flight = config['READY_MAX_IN_FLIGHT']
+        if max_in_flight is None and shared is not None:
+            # saturated when every other worker is busy - never with a single worker
+            max_in_flight = shared.workers - 1
+        problems = []
+        if not database['ok']:
+            problems.append('database unreachable')
+        if ready:
+            if max_in_flight and in_flight >= max_in_flight:
+                problems.append('too many requests in flight')
+            if backlog is not None and backlog >= config['READY_MAX_BACKLOG']:
+                problems.append('too many connections waiting')
+            if database['pool_wait_ms'] is not None and \
+                    database['pool_wait_ms'] >= config['READY_MAX_POOL_WAIT'] * 1000:
+                problems.append('slow connection pool checkout')
+            if exhausted:
+                problems.append('connection pool exhausted')
+        body = {
+            'status': 'fail' if problems else 'ok',
+            'problems': problems,
+            'in_flight': in_flight,
+            'backlog': backlog,
+            'database': database,
+            'pool': pool,
+        }
+        return not problems, body
+
+
+monitor = LoadMonitor()
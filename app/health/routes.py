@@ -0,0 +1,33 @@
+from app.health import bp
+from app.health.monitor import monitor
+from app.jsonprovider import jsonify
+
+
+@bp.before_app_request
+def count_request():
+    monitor.request_started()
+
+
+@bp.teardown_app_request
+def uncount_request(exc):
+    monitor.request_finished()
+
+
+def _status_response(ready):
+    healthy, body = monitor.status(ready)
+    response = jsonify(body)
+    response.status_code = 200 if healthy else 503
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@bp.route('/healthz')
+def healthz():
+    """ Liveness: the process answers and reaches the database. """
+    return _status_response(ready=False)
+
+
+@bp.route('/readyz')
+def readyz():
+    """ Readiness: like /healthz, but also 503 when the server is saturated, so traffic drains. """
+    return _status_response(ready=True)
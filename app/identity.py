@@ -0,0 +1,176 @@
+"""
+User identity cache.
+Users looked up by id (load_user), username or API token are kept on `g` until the
+end of the request and as column snapshots in a small per-process cache shared
+by requests for IDENTITY_CACHE_TTL seconds. Snapshots are replaced after every
+committed change of a User and dropped when the user is deleted.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+
+
+class IdentityCache:
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()     # id -> (expires, snapshot)
+        self._keys = {}                     # ('username' | 'token', value) -> id
+        self._listening = False
+        self.ttl = 5.0
+        self.maxsize = 1024
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import db
+
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL', self.ttl)
+        self.maxsize = app.config.get('IDENTITY_CACHE_SIZE', self.maxsize)
+        app.config.setdefault('REPORT_DUPLICATE_QUERIES', app.debug)
+        app.extensions['identity'] = self
+        if not self._listening:
+            event.listen(db.session, 'after_flush', self._after_flush)
+            event.listen(db.session, 'after_commit', self._after_commit)
+            event.listen(db.session, 'after_soft_rollback', self._after_rollback)
+            event.listen(Engine, 'before_cursor_execute', _count_query)
+            self._listening = True
+        app.teardown_request(_end_request)
+
+    # lookups
+
+    def get_by_id(self, user_id):
+        from app.models import User
+        return self._get('id', user_id, lambda: User.query.get(user_id))
+
+    def get_by_username(self, username):
+        from app.models import User
+        return self._get('username', username, lambda: User.query.filter_by(username=username).first())
+
+    def get_by_token(self, token):
+        from app.models import User
+        return self._get('token', token, lambda: User.query.filter_by(token=token).first())
+
+    def _get(self, kind, value, load):
+        local = g.setdefault('_identity', {}) if has_request_context() else {}
+        user = local.get((kind, value))
+        if user is not None:
+            return user
+
+        user_id = value if kind == 'id' else self._keys.get((kind, value))
+        snapshot = self._snapshot(user_id) if user_id is not None else None
+        if snapshot is not None and (kind == 'id' or snapshot[kind] == value):
+            user = self._attach(snapshot)
+        else:
+            user = load()
+            if user is not None:
+                self._store(_take_snapshot(user))
+        if user is not None:
+            local[(kind, value)] = user
+        return user
+
+    # per-process snapshots
+
+    def _snapshot(self, user_id):
+        with self._lock:
+            entry = self._snapshots.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(user_id)
+                return None
+            self._snapshots.move_to_end(user_id)
+            return entry[1]
+
+    def _store(self, snapshot):
+        with self._lock:
+            self._drop(snapshot['id'])
+            self._snapshots[snapshot['id']] = (time.monotonic() + self.ttl, snapshot)
+            self._keys[('username', snapshot['username'])] = snapshot['id']
+            if snapshot['token']:
+                self._keys[('token', snapshot['token'])] = snapshot['id']
+            while len(self._snapshots) > self.maxsize:
+                self._drop(next(iter(self._snapshots)))
+
+    def _drop(self, user_id):
+        """ Remove a snapshot and its secondary keys. Call with the lock held. """
+        entry = self._snapshots.pop(user_id, None)
+        if entry is not None:
+            snapshot = entry[1]
+            self._keys.pop(('username', snapshot['username']), None)
+            self._keys.pop(('token', snapshot['token']), None)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._drop(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+            self._keys.clear()
+
+    @staticmethod
+    def _attach(snapshot):
+        """ Build a persistent User in the current session from a snapshot, without a query. """
+        from app import db
+        from app.models import User
+
+        existing = db.session.identity_map.get(identity_key(User, snapshot['id']))
+        if existing is not None:
+            return existing
+        user = User.__mapper__.class_manager.new_instance()
+        for key, value in snapshot.items():
+            setattr(user, key, value)
+        make_transient_to_detached(user)
+        db.session.add(user)
+        return user
+
+    # session events
+
+    def _after_flush(self, session, flush_context):
+        from app.models import User
+
+        pending = session.info.setdefault('identity_pending', {})
+        for obj in session.new | session.dirty:
+            if isinstance(obj, User):
+                pending[obj.id] = _take_snapshot(obj)
+        for obj in session.deleted:
+            if isinstance(obj, User):
+                pending[obj.id] = None
+
+    def _after_commit(self, session):
+        pending = session.info.pop('identity_pending', {})
+        for user_id, snapshot in pending.items():
+            if snapshot is None:
+                self.invalidate(user_id)
+            else:
+                self._store(snapshot)
+
+    def _after_rollback(self, session, previous_transaction):
+        session.info.pop('identity_pending', None)
+
+
+def _take_snapshot(user):
+    return {column.key: getattr(user, column.key) for column in user.__table__.columns}
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and current_app.config.get('REPORT_DUPLICATE_QUERIES'):
+        queries = g.setdefault('_queries', Counter())
+        queries[(statement, repr(parameters))] += 1
+
+
+def _end_request(exc):
+    g.pop('_identity', None)
+    queries = g.pop('_queries', None)
+    if not queries:
+        return
+    duplicates = [(count, statement) for (statement, _), count in queries.items() if count > 1]
+    if duplicates:
+        current_app.logger.debug('%d duplicate queries in %s %s:\n%s', len(duplicates), request.method,
+                                 request.path,
+                                 '\n'.join(f'{count}x {statement}' for count, statement in sorted(duplicates)))
@@ -0,0 +1,173 @@
+import json
+import multiprocessing
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models import Job
+
+_registry = {}
+
+
+def job(name=None, max_attempts=None):
+    """
+    Decorator registering a function as a background job handler.
+    The handler is called with the keyword arguments passed to enqueue().
+    :param name: job name, defaults to 'module.function'
+    :param max_attempts: overrides JOB_MAX_ATTEMPTS for this job
+    """
+    def decorator(f):
+        job_name = name or f'{f.__module__}.{f.__name__}'
+        f.job_name = job_name
+        f.max_attempts = max_attempts
+        _registry[job_name] = f
+        return f
+    return decorator
+
+
+def enqueue(task, key=None, delay=0, **payload):
+    """
+    Add a job to the queue in the current session.
+    Nothing is committed here - the job becomes visible together with the caller's
+    own changes, so a route can enqueue and return as soon as it commits.
+    :param task: registered job name or the handler function itself
+    :param key: idempotency key; a second enqueue with the same key returns the first job
+    :param delay: seconds to wait before the job can run
+    :param payload: JSON serializable keyword arguments for the handler
+    :return: Job instance
+    """
+    name = task.job_name if callable(task) else task
+    if key is not None:
+        existing = Job.query.filter_by(idempotency_key=key).first()
+        if existing is not None:
+            return existing
+
+    handler = _registry.get(name)
+    max_attempts = getattr(handler, 'max_attempts', None) or current_app.config['JOB_MAX_ATTEMPTS']
+    item = Job(name=name,
+               payload=json.dumps(payload),
+               idempotency_key=key,
+               status='queued',
+               attempts=0,
+               max_attempts=max_attempts,
+               run_at=datetime.utcnow() + timedelta(seconds=delay))
+    db.session.add(item)
+    return item
+
+
+def backoff(attempts):
+    """ Exponential backoff with jitter, in seconds, after the given number of attempts. """
+    base = current_app.config['JOB_BACKOFF_BASE']
+    delay = min(base * 2 ** max(attempts - 1, 0), current_app.config['JOB_BACKOFF_MAX'])
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim(worker_id, batch=10):
+    """
+    Take the next due job and mark it as running.
+    The conditional UPDATE makes the claim atomic between worker processes.
+    :return: Job or None when nothing is due
+    """
+    now = datetime.utcnow()
+    candidates = db.session.query(Job.id) \
+        .filter(Job.status == 'queued', Job.run_at <= now) \
+        .order_by(Job.run_at, Job.id) \
+        .limit(batch).all()
+    for (job_id,) in candidates:
+        claimed = Job.query.filter_by(id=job_id, status='queued').update({
+            'status': 'running',
+            'locked_by': worker_id,
+            'locked_at': now,
+            'attempts': Job.attempts + 1,
+            'modified_at': now
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed == 1:
+            return Job.query.get(job_id)
+    return None
+
+
+def execute(item):
+    """ Run a claimed job and record the result, scheduling a retry on failure. """
+    handler = _registry.get(item.name)
+    try:
+        if handler is None:
+            raise LookupError(f'no handler registered for job {item.name!r}')
+        handler(**json.loads(item.payload or '{}'))
+    except Exception:
+        db.session.rollback()
+        item.last_error = traceback.format_exc()
+        if item.attempts >= item.max_attempts:
+            item.status = 'failed'
+            current_app.logger.error('Job %s (%s) failed permanently', item.id, item.name)
+        else:
+            item.status = 'queued'
+            item.run_at = datetime.utcnow() + timedelta(seconds=backoff(item.attempts))
+    else:
+        item.status = 'done'
+        item.last_error = None
+    item.locked_by = None
+    item.modified_at = datetime.utcnow()
+    db.session.commit()
+    return item.status
+
+
+def requeue_stale():
+    """
+    Return jobs of crashed workers to the queue - or fail them when they used up their attempts,
+    a handler which kills its worker every time is not retried forever.
+    :return: number of requeued jobs
+    """
+    now = datetime.utcnow()
+    stale = db.and_(Job.status == 'running',
+                    Job.locked_at < now - timedelta(seconds=current_app.config['JOB_LOCK_TIMEOUT']))
+    failed = Job.query.filter(stale, Job.attempts >= Job.max_attempts) \
+        .update({'status': 'failed', 'locked_by': None, 'modified_at': now,
+                 'last_error': 'worker stopped while running the job'}, synchronize_session=False)
+    if failed:
+        current_app.logger.error('%d stale jobs failed permanently', failed)
+    count = Job.query.filter(stale, Job.attempts < Job.max_attempts) \
+        .update({'status': 'queued', 'locked_by': None, 'modified_at': now}, synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+def work(app, burst=False):
+    """
+    Worker loop: claim and execute jobs until stopped.
+    :param app: application instance
+    :param burst: exit as soon as the queue is empty
+    """
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    with app.app_context():
+        # connections inherited from the parent process must not be shared
+        db.engine.dispose()
+        requeue_stale()
+        while True:
+            item = claim(worker_id)
+            if item is None:
+                if burst:
+                    break
+                time.sleep(app.config['JOB_POLL_INTERVAL'])
+                continue
+            execute(item)
+            db.session.remove()
+
+
+def run_workers(app, processes=None, burst=False):
+    """ Start a pool of worker processes forked from the already loaded application. """
+    processes = processes or app.config['JOB_WORKERS']
+    workers = [multiprocessing.Process(target=work, args=(app, burst), daemon=True)
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
@@ -0,0 +1,103 @@
+import gzip
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from flask import current_app, request, json
+from werkzeug.wrappers import Response
+
+try:
+    import orjson
+except ImportError:         # stdlib json is used instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError:         # only gzip is offered
+    brotli = None
+
+JSON_TYPES = (str, int, float, bool, type(None), list, tuple, dict, datetime, date)
+
+
+def isoformat(value):
+    """ Naive datetimes in the database are UTC. """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.isoformat()
+
+
+def default(o):
+    """ Types that are not JSON natively: datetimes, Decimal and models with to_dict(). """
+    if isinstance(o, datetime):
+        return isoformat(o)
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return float(o)
+    if hasattr(o, 'to_dict'):
+        return o.to_dict()
+    raise TypeError(f'Object of type {o.__class__.__name__} is not JSON serializable')
+
+
+class JSONEncoder(json.JSONEncoder):
+    """ app.json_encoder - also used by flask.json.dumps and tojson in templates. """
+    def default(self, o):
+        try:
+            return default(o)
+        except TypeError:
+            return super().default(o)
+
+
+class JSONProvider:
+    """
+    Compact JSON serialization for API responses.
+    Uses orjson when it is installed, a tuned stdlib encoder otherwise, and compresses
+    large responses with br or gzip when the client accepts it.
+    """
+    def __init__(self, app=None):
+        self._encoder = json.JSONEncoder(separators=(',', ':'), default=default)
+        self.compress_min_size = 1024
+        self.compress_level = 6
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.json_encoder = JSONEncoder
+        app.config.setdefault('JSONIFY_PRETTYPRINT_REGULAR', False)
+        self.compress_min_size = app.config.get('JSON_COMPRESS_MIN_SIZE', self.compress_min_size)
+        self.compress_level = app.config.get('JSON_COMPRESS_LEVEL', self.compress_level)
+        app.extensions['json_provider'] = self
+
+    def dumps(self, obj):
+        """ :return: UTF-8 encoded bytes """
+        if orjson is not None:
+            return orjson.dumps(obj, default=default, option=orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS)
+        return self._encoder.encode(obj).encode('utf-8')
+
+    def compress(self, body):
+        """
+        Pick the best encoding accepted by the client.
+        :return: tuple (body, content encoding or None)
+        """
+        if len(body) < self.compress_min_size:
+            return body, None
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            return brotli.compress(body, quality=4), 'br'
+        if accepted['gzip']:
+            return gzip.compress(body, self.compress_level), 'gzip'
+        return body, None
+
+    def response(self, data, status=200):
+        body, encoding = self.compress(self.dumps(data))
+        response = Response(body, status=status, mimetype=current_app.config['JSONIFY_MIMETYPE'])
+        response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+
+def jsonify(*args, **kwargs):
+    """ Drop-in replacement of flask.jsonify using the application's JSONProvider. """
+    if args and kwargs:
+        raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+    data = args[0] if len(args) == 1 else (args or kwargs)
+    return current_app.extensions['json_provider'].response(data)
@@ -0,0 +1,281 @@
+"""
+Structured, non-blocking application logging.
+
+Request threads only put records on a bounded in-memory queue (QueueHandler);
+a background thread formats them as JSON lines and appends them to the log file
+in batches of up to LOG_BATCH_SIZE records or every LOG_FLUSH_INTERVAL seconds.
+The file is rotated when it reaches LOG_MAX_BYTES or when a new LOG_ROTATE_INTERVAL
+period starts; several processes (server and job workers) may share one file.
+Every request gets an id (X-Request-ID) and an access log line with its duration,
+INFO access lines are sampled with LOG_ACCESS_SAMPLE_RATE.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+import weakref
+from datetime import datetime, timezone
+from flask import g, has_request_context, request
+
+try:
+    import fcntl
+except ImportError:         # no locking between processes during rotation
+    fcntl = None
+
+_STOP = object()
+_listeners = weakref.WeakSet()
+
+
+class JSONFormatter(logging.Formatter):
+    """ One JSON object per line; `extra={'data': {...}}` adds fields to it. """
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['request_id'] = request_id
+        entry.update(getattr(record, 'data', None) or {})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, separators=(',', ':'), default=str)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Leaves formatting to the writer thread - a record only gets its message and request id here.
+    When the queue is full records are dropped and counted instead of blocking the request.
+    """
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if not hasattr(record, 'request_id'):
+            record.request_id = g.get('request_id') if has_request_context() else None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RotatingBatchFile:
+    """ Append-only log file written a batch at a time, rotated by size and time. """
+    def __init__(self, path, max_bytes, backup_count, interval):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.interval = interval
+        self._file = None
+
+    def write(self, data):
+        self._rotate_if_needed(len(data))
+        stream = self._stream()
+        stream.write(data)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _stream(self):
+        """ Open file, reopened after another process rotated it. """
+        if self._file is not None:
+            try:
+                current = os.stat(self.path)
+            except FileNotFoundError:
+                current = None
+            opened = os.fstat(self._file.fileno())
+            if current is None or (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino):
+                self.close()
+        if self._file is None:
+            self._file = open(self.path, 'ab', buffering=0)
+        return self._file
+
+    def _should_rotate(self, incoming):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if not stat.st_size:
+            return False
+        if stat.st_size + incoming > self.max_bytes:
+            return True
+        return self.interval and stat.st_mtime // self.interval < time.time() // self.interval
+
+    def _rotate_if_needed(self, incoming):
+        if not self._should_rotate(incoming):
+            return
+        with open(self.path + '.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            # another process may have rotated while we waited for the lock
+            if not self._should_rotate(incoming):
+                return
+            for i in range(self.backup_count - 1, 0, -1):
+                source = f'{self.path}.{i}'
+                if os.path.exists(source):
+                    os.replace(source, f'{self.path}.{i + 1}')
+            if self.backup_count:
+                os.replace(self.path, self.path + '.1')
+            else:
+                os.remove(self.path)
+        self.close()
+
+
+class BatchListener:
+    """ Background thread moving records from the queue to the file in batches. """
+    def __init__(self, queue_handler, target, formatter, batch_size, flush_interval):
+        self.queue_handler = queue_handler
+        self.target = target
+        self.formatter = formatter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._thread = None
+        _listeners.add(self)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Write everything queued so far and stop the thread. """
+        if self._thread is not None and self._thread.is_alive():
+            self.queue_handler.queue.put(_STOP)
+            self._thread.join()
+        self._thread = None
+        self.target.close()
+
+    def _after_fork(self):
+        """ Threads don't survive fork() - the child gets its own queue and writer. """
+        if self._thread is not None:
+            self.queue_handler.queue = queue.Queue(self.queue_handler.queue.maxsize)
+            self.target.close()
+            self.start()
+
+    def _run(self):
+        records = self.queue_handler.queue
+        while True:
+            batch = [records.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(records.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._write([record for record in batch if record is not _STOP])
+            if batch[-1] is _STOP:
+                return
+
+    def _write(self, batch):
+        if self.queue_handler.dropped:
+            dropped, self.queue_handler.dropped = self.queue_handler.dropped, 0
+            batch.append(logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f'{dropped} log records dropped, the queue was full'}))
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.formatter.format(record))
+            except Exception:
+                logging.Handler.handleError(self.queue_handler, record)
+        if lines:
+            try:
+                self.target.write(('\n'.join(lines) + '\n').encode('utf-8'))
+            except OSError:
+                logging.Handler.handleError(self.queue_handler, batch[0])
+
+
+def _after_fork():
+    for listener in list(_listeners):
+        listener._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+class RequestLogging:
+    def __init__(self, app=None):
+        self.sample_rate = 1.0
+        self.slow_request = 1.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.sample_rate = app.config.get('LOG_ACCESS_SAMPLE_RATE', self.sample_rate)
+        self.slow_request = app.config.get('LOG_SLOW_REQUEST', self.slow_request)
+        app.before_request(_start_request)
+        app.after_request(self._log_request)
+        app.extensions['request_logging'] = self
+        self.access = app.logger.getChild('access')
+
+        if not app.debug and not app.testing:
+            listener = file_listener(app.config)
+            listener.start()
+            atexit.register(listener.stop)
+            app.logger.addHandler(listener.queue_handler)
+            app.logger.setLevel(logging.INFO)
+            app.extensions['log_listener'] = listener
+
+    def _log_request(self, response):
+        if 'request_start' not in g:
+            return response
+        duration = time.perf_counter() - g.request_start
+        response.headers['X-Request-ID'] = g.request_id
+        if response.status_code >= 500 or duration >= self.slow_request:
+            level = logging.WARNING
+        elif self.sample_rate >= 1 or random.random() < self.sample_rate:
+            level = logging.INFO
+        else:
+            return response
+        self.access.log(level, '%s %s %s', request.method, request.path, response.status_code, extra={'data': {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'remote_addr': request.remote_addr,
+        }})
+        return response
+
+
+def file_listener(config):
+    """ Queue handler + batch writer for LOG_DIR/LOG_FILE (not started). """
+    os.makedirs(config['LOG_DIR'], exist_ok=True)
+    target = RotatingBatchFile(os.path.join(config['LOG_DIR'], config['LOG_FILE']),
+                               config['LOG_MAX_BYTES'], config['LOG_BACKUP_COUNT'],
+                               config['LOG_ROTATE_INTERVAL'])
+    handler = QueueHandler(queue.Queue(config['LOG_QUEUE_SIZE']))
+    handler.setLevel(logging.INFO)
+    return BatchListener(handler, target, JSONFormatter(), config['LOG_BATCH_SIZE'],
+                         config['LOG_FLUSH_INTERVAL'])
+
+
+def flush():
+    """ Write queued records of all listeners, e.g. before os._exit() in a worker process. """
+    for listener in list(_listeners):
+        listener.stop()
+
+
+def _start_request():
+    g.request_id = request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex
+    g.request_start = time.perf_counter()
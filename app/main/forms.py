@@ -1,7 +1,7 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, TextAreaField,  SubmitField, FloatField
 from wtforms.validators import DataRequired, ValidationError, Length
-from app.models import User
+from app import identity
 
 
 class EditProfileForm(FlaskForm):
@@ -18,7 +18,7 @@ class EditProfileForm(FlaskForm):
 
     def validate_username(self, username):
         if username.data != self.original_username:
-            user = User.query.filter_by(username=self.username.data).first()
+            user = identity.get_by_username(self.username.data)
             if user is not None:
                 raise ValidationError('Please use a different username.')
 
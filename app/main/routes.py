@@ -1,10 +1,11 @@
 from datetime import datetime
-from flask import render_template, flash, redirect, url_for, request
+from flask import render_template, flash, redirect, url_for, request, abort, current_app
 from flask_login import current_user, login_required
-from app import db
+from app import archive, db, identity
 from app.main.forms import EditProfileForm, AddFisheryForm
 from app.models import User, Fishery
 from app.main import bp
+from app.sharding import shards
 
 
 @bp.before_request
@@ -34,11 +35,11 @@ def index():
 @bp.route('/user/<username>')
 @login_required
 def user(username):
-    user = User.query.filter_by(username=username).first_or_404()
-    posts = [
-        {'author': user, 'body': 'Test post #1'},
-        {'author': user, 'body': 'Test post #2'}
-    ]
+    user = identity.get_by_username(username)
+    if user is None:
+        abort(404)
+    # both tiers, like post_count - old posts are in the archive
+    posts = archive.user_posts(user.id).limit(current_app.config['POSTS_PER_PAGE']).all()
 
     return render_template('user.html', user=user, posts=posts)
 
@@ -63,7 +64,7 @@ def edit_profile():
 @bp.route('/fisheries')
 @login_required
 def get_all_fisheries():
-    fisheries = Fishery.query.all()
+    fisheries = shards.all()
 
     return render_template('fisheries.html', title='Fisheries', fisheries=fisheries)
 
@@ -79,8 +80,9 @@ def add_fishery():
         fishery.place = form.place.data
         fishery.longitude = form.longitude.data
         fishery.latitude = form.latitude.data
-        db.session.add(fishery)
-        db.session.commit()
+        fishery.created_by = current_user.id
+        shards.add(fishery)
+        shards.commit()
         flash('New fishery has been added.')
         return redirect(url_for('main.user', username=current_user.username))
 
@@ -1,16 +1,19 @@
 from datetime import datetime, timedelta
 import base64
+import json
 import os
+from sqlalchemy import DDL, MetaData, event
+from sqlalchemy.orm import object_session
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask import url_for
 from flask_login import UserMixin
-from app import login, db
+from app import login, db, identity
 from app.apihelper import PaginatedApiMixin, ApiBaseModel
 
 
 users_fisheries = db.Table('users_fisheries',
-                           db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
-                           db.Column('fishery_id', db.Integer, db.ForeignKey('fishery.id'))
+                           db.Column('user_id', db.Integer, db.ForeignKey('user.id'), index=True),
+                           db.Column('fishery_id', db.Integer, db.ForeignKey('fishery.id'), index=True)
                            )
 
 
@@ -18,17 +21,24 @@ class User(PaginatedApiMixin, UserMixin, ApiBaseModel):
     """ 'user' table in database
         class UserMixin adds: is_authenticated, is_active, is_anonymous, get_id()
     """
+    __table_args__ = (
+        db.Index('ix_user_created_at_id', 'created_at', 'id'),
+        db.Index('ix_user_modified_at_id', 'modified_at', 'id'),      # app.sync
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     modified_at = db.Column(db.DateTime)
     username = db.Column(db.String(64), index=True, unique=True)
     email = db.Column(db.String(120), index=True, unique=True)
-    email_confirmed = db.Column(db.Boolean)                         # dopisać obsługę
+    email_confirmed = db.Column(db.Boolean)                         # app.auth.tasks
     password_hash = db.Column(db.String(128))
     token = db.Column(db.String(32), index=True, unique=True)
-    token_expiration = db.Column(db.DateTime)
+    token_expiration = db.Column(db.DateTime, index=True)
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)     # to nie działa dla api
     about_me = db.Column(db.String(140))
+    post_count = db.Column(db.Integer, default=0, server_default='0')        # app.counters
+    fishery_count = db.Column(db.Integer, default=0, server_default='0')
     posts = db.relationship('Post', backref='author', lazy='dynamic')
     fisheries = db.relationship('Fishery', backref='author', lazy='dynamic')
 
@@ -46,7 +56,17 @@ class User(PaginatedApiMixin, UserMixin, ApiBaseModel):
     ]
     _readonly_fields = [
         'email_confirmed',
-        'modified_at'
+        'modified_at',
+        'post_count',
+        'fishery_count'
+    ]
+    _volatile_fields = [
+        'last_seen'
+    ]
+    # shown to the user only (templates), never in the API or the change outbox
+    _private_fields = [
+        'email',
+        'email_confirmed'
     ]
 
     def __repr__(self):
@@ -85,7 +105,7 @@ class User(PaginatedApiMixin, UserMixin, ApiBaseModel):
 
     @staticmethod
     def check_token(token):
-        user = User.query.filter_by(token=token).first()
+        user = identity.get_by_token(token)
         if user is None or user.token_expiration < datetime.utcnow():
             return None
 
@@ -94,6 +114,14 @@ class User(PaginatedApiMixin, UserMixin, ApiBaseModel):
 
 class Post(db.Model):
     """ 'post' table in database """
+    __table_args__ = (
+        db.Index('ix_post_created_at_id', 'created_at', 'id'),
+        db.Index('ix_post_modified_at_id', 'modified_at', 'id'),      # app.sync
+        db.Index('ix_post_user_id_created_at', 'user_id', 'created_at'),
+        # AUTOINCREMENT: ids of archived posts (app/archive.py) are never given to new posts
+        {'sqlite_autoincrement': True}
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     created_at = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     modified_at = db.Column(db.DateTime)
@@ -108,7 +136,47 @@ class Post(db.Model):
         return f'<Post {self.body}>'
 
 
+class PostArchive(db.Model):
+    """ 'post_archive' table - posts older than POST_RETENTION_DAYS, moved by app.archive """
+    __tablename__ = 'post_archive'
+    __table_args__ = (
+        db.Index('ix_post_archive_user_id_created_at', 'user_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    created_at = db.Column(db.DateTime)
+    modified_at = db.Column(db.DateTime)
+    body = db.Column(db.String(140))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<PostArchive {self.body}>'
+
+
+POST_COLUMNS = ['id', 'created_at', 'modified_at', 'body', 'user_id']
+
+# read-only view over both tiers, created together with post_archive; not part of db.metadata
+post_all = db.Table('post_all', MetaData(),
+                    db.Column('id', db.Integer, primary_key=True),
+                    db.Column('created_at', db.DateTime),
+                    db.Column('modified_at', db.DateTime),
+                    db.Column('body', db.String(140)),
+                    db.Column('user_id', db.Integer))
+
+POST_ALL_VIEW = 'CREATE VIEW post_all AS SELECT {0} FROM post UNION ALL SELECT {0} FROM post_archive'.format(
+    ', '.join(POST_COLUMNS))
+event.listen(PostArchive.__table__, 'after_create', DDL(POST_ALL_VIEW))
+event.listen(PostArchive.__table__, 'before_drop', DDL('DROP VIEW IF EXISTS post_all'))
+
+
 class Fishery(PaginatedApiMixin, ApiBaseModel):
+    __table_args__ = (
+        db.Index('ix_fishery_created_at_id', 'created_at', 'id'),
+        db.Index('ix_fishery_modified_at_id', 'modified_at', 'id'),      # app.sync
+        db.Index('ix_fishery_country_created_at', 'country', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     modified_at = db.Column(db.DateTime)
@@ -117,45 +185,144 @@ class Fishery(PaginatedApiMixin, ApiBaseModel):
     place = db.Column(db.String(140))
     longitude = db.Column(db.Float)
     latitude = db.Column(db.Float)
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    user_count = db.Column(db.Integer, default=0, server_default='0')        # app.counters
 
     _default_fields = [
         'reservoir_name',
         'country',
         'place',
         'longitude',
-        'latitude'
+        'latitude',
+        'links'
     ]
     _hidden_fields = []
-    _readonly_fields = []
+    _readonly_fields = [
+        'user_count'
+    ]
+    _sortable_fields = ['id', 'created_at', 'reservoir_name', 'country']
+    _item_endpoint = 'api.get_fishery'
 
     def __repr__(self):
         return f'<Fishery {self.reservoir_name}>'
 
+    def add_angler(self, user):
+        """ Link a user with this fishery in 'users_fisheries', keeping user_count up to date. """
+        session = object_session(self) or db.session
+        session.execute(users_fisheries.insert().values(user_id=user.id, fishery_id=self.id))
+        session.execute(Fishery.__table__.update()
+                        .where(Fishery.id == self.id)
+                        .values(user_count=Fishery.user_count + 1, modified_at=datetime.utcnow()))
+
+    def remove_angler(self, user):
+        session = object_session(self) or db.session
+        result = session.execute(users_fisheries.delete().where(db.and_(
+            users_fisheries.c.user_id == user.id,
+            users_fisheries.c.fishery_id == self.id)))
+        if result.rowcount:
+            session.execute(Fishery.__table__.update()
+                            .where(Fishery.id == self.id)
+                            .values(user_count=Fishery.user_count - result.rowcount,
+                                    modified_at=datetime.utcnow()))
+
     @property
     def links(self):
-        return {'self': url_for('api.get_fishery', id=self.id)}
+        return {'self': url_for(self._item_endpoint, id=self.id)}
 
 
 class Fish(PaginatedApiMixin, ApiBaseModel):
+    __table_args__ = (
+        db.Index('ix_fish_created_at_id', 'created_at', 'id'),
+        db.Index('ix_fish_modified_at_id', 'modified_at', 'id'),      # app.sync
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     modified_at = db.Column(db.DateTime)
     species = db.Column(db.String(40), index=True, unique=True)
     description = db.Column(db.String(140))
     photos = db.Column(db.String(80))
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
 
     _default_fields = [
         'species',
         'description',
-        'photos'
+        'photos',
+        'links'
     ]
 
     _hidden_fields = []
     _readonly_fields = []
+    _sortable_fields = ['id', 'created_at', 'species']
+    _item_endpoint = 'api.get_fish'
+
+    def __repr__(self):
+        return f'<Fish {self.species}>'
+
+    @property
+    def links(self):
+        return {'self': url_for(self._item_endpoint, id=self.id)}
+
+
+class Job(db.Model):
+    """ 'job' table in database - persistent queue used by app.jobs """
+    __table_args__ = (db.Index('ix_job_status_run_at', 'status', 'run_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    modified_at = db.Column(db.DateTime)
+    name = db.Column(db.String(64))
+    payload = db.Column(db.Text)
+    idempotency_key = db.Column(db.String(128), index=True, unique=True)
+    status = db.Column(db.String(16), default='queued')
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=5)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow)
+    locked_by = db.Column(db.String(64))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+    def __repr__(self):
+        return f'<Job {self.name} {self.status}>'
+
+
+class ChangeEvent(db.Model):
+    """ 'change_event' table - append-only outbox of model changes written by app.changes """
+    __tablename__ = 'change_event'
+    # AUTOINCREMENT: ids are never reused, consumers resume after the last id they have seen.
+    # Reads go by id range only - an index on entity would make SQLite sort whole entities.
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    entity = db.Column(db.String(32))
+    entity_id = db.Column(db.Integer)
+    op = db.Column(db.String(8))            # insert, update, delete
+    changes = db.Column(db.Text)            # JSON {field: {'old': ..., 'new': ...}}
+
+    def __repr__(self):
+        return f'<ChangeEvent {self.id} {self.op} {self.entity} {self.entity_id}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'created_at': self.created_at,
+            'entity': self.entity,
+            'entity_id': self.entity_id,
+            'op': self.op,
+            'changes': json.loads(self.changes) if self.changes else None
+        }
+
+
+class IdSequence(db.Model):
+    """ 'id_sequence' table - ids of rows stored in several databases (app/sharding.py) """
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.Integer, default=0)
+
+    def __repr__(self):
+        return f'<IdSequence {self.name} {self.value}>'
 
 
 @login.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return identity.get_by_id(int(user_id))
@@ -0,0 +1,38 @@
+import os
+from flask import abort, current_app, redirect, send_file, url_for
+from app.photos import bp
+from app.photos.storage import photo_path, split_name
+
+
+def _send_photo(name, variant):
+    """
+    Serve a stored file. Names are content addresses, so the files never change:
+    no database lookup, conditional/range requests and immutable caching.
+    """
+    if split_name(name) is None:
+        abort(404)
+    path = photo_path(name, variant)
+    if not os.path.exists(path):
+        return None
+    response = send_file(path, conditional=True)
+    response.headers['Cache-Control'] = \
+        f'public, max-age={current_app.config["PHOTOS_CACHE_MAX_AGE"]}, immutable'
+    return response
+
+
+@bp.route('/<name>')
+def get_photo(name):
+    response = _send_photo(name, 'originals')
+    if response is None:
+        abort(404)
+    return response
+
+
+@bp.route('/thumbs/<name>')
+def get_thumbnail(name):
+    response = _send_photo(name, 'thumbs')
+    if response is None:
+        # thumbnail not generated yet - the redirect itself must not be cached
+        response = redirect(url_for('photos.get_photo', name=name))
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
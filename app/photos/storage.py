@@ -0,0 +1,75 @@
+import hashlib
+import os
+import re
+import tempfile
+from flask import current_app
+
+ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
+NAME_RE = re.compile(r'^([0-9a-f]{64})\.(' + '|'.join(sorted(ALLOWED_EXTENSIONS)) + r')$')
+CHUNK_SIZE = 64 * 1024
+
+
+def split_name(name):
+    """
+    Split a stored photo name '<sha256>.<ext>' into (digest, ext).
+    :return: tuple or None for names which are not content addresses
+    """
+    match = NAME_RE.match(name or '')
+    return (match.group(1), match.group(2)) if match else None
+
+
+def extension(filename):
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return 'jpg' if ext == 'jpeg' else ext
+
+
+def sniff(stream):
+    """
+    File type from the first bytes of an upload, the stream is rewound afterwards.
+    :return: extension (one of ALLOWED_EXTENSIONS, 'jpg' for JPEG) or None when it is no known image
+    """
+    header = stream.read(12)
+    stream.seek(0)
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def photo_path(name, variant='originals'):
+    """ Location of a photo on disk: <PHOTOS_DIR>/<variant>/ab/cd/<name> """
+    return os.path.join(current_app.config['PHOTOS_DIR'], variant, name[:2], name[2:4], name)
+
+
+def save(stream, ext):
+    """
+    Store an uploaded file under its SHA-256 content address.
+    The upload is hashed while it is copied to a temporary file, identical files are stored once.
+    :param stream: file-like object
+    :param ext: file extension (one of ALLOWED_EXTENSIONS)
+    :return: tuple (name, created) where created is False for a duplicate upload
+    """
+    tmp_dir = os.path.join(current_app.config['PHOTOS_DIR'], 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                tmp.write(chunk)
+        name = f'{digest.hexdigest()}.{ext}'
+        path = photo_path(name)
+        if os.path.exists(path):
+            return name, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return name, True
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
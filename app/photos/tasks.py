@@ -0,0 +1,29 @@
+import os
+from flask import current_app
+from app.jobs import job
+from app.photos.storage import photo_path
+
+try:
+    from PIL import Image
+except ImportError:         # thumbnails are optional, originals are served without them
+    Image = None
+
+
+def thumbnails_enabled():
+    return Image is not None
+
+
+@job('photos.make_thumbnail')
+def make_thumbnail(name):
+    if Image is None:
+        # fail (and retry) instead of finishing - the job's idempotency key would block a new one
+        raise RuntimeError(f'Pillow is not installed, no thumbnail for {name}')
+    target = photo_path(name, 'thumbs')
+    if os.path.exists(target):
+        return
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = f'{target}.{os.getpid()}.tmp'
+    with Image.open(photo_path(name)) as image:
+        image.thumbnail(current_app.config['THUMBNAIL_SIZE'])
+        image.save(tmp_path, format=image.format)
+    os.replace(tmp_path, target)
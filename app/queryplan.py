@@ -0,0 +1,192 @@
+"""
+Query plan checks for the queries issued by the web and API routes.
+Every known query is run through SQLite's EXPLAIN QUERY PLAN; a plan which scans
+a whole table (or sorts it in a temporary B-tree) means an index is missing.
+"""
+from datetime import datetime
+from sqlalchemy import text
+from app import db
+from app.models import User, Post, PostArchive, ChangeEvent, Fishery, Fish, Job, users_fisheries
+from app.sync import changed_statement
+
+KNOWN_QUERIES = []
+
+# indexes added by the 'indexes for hot query paths' migration, dropped by the benchmark
+HOT_PATH_INDEXES = [
+    'ix_user_created_at_id',
+    'ix_user_token_expiration',
+    'ix_post_created_at_id',
+    'ix_post_user_id_created_at',
+    'ix_fishery_created_at_id',
+    'ix_fishery_created_by',
+    'ix_fish_created_at_id',
+    'ix_fish_created_by',
+    'ix_users_fisheries_user_id',
+    'ix_users_fisheries_fishery_id'
+]
+
+
+def known_query(name):
+    """ Register a function returning a Query (or a Core select) used by the application. """
+    def decorator(f):
+        KNOWN_QUERIES.append((name, f))
+        return f
+    return decorator
+
+
+@known_query('load_user')
+def _load_user():
+    return User.query.filter(User.id == 1)
+
+
+@known_query('user by username')
+def _user_by_username():
+    return User.query.filter_by(username='angler')
+
+
+@known_query('user by email')
+def _user_by_email():
+    return User.query.filter_by(email='angler@example.com')
+
+
+@known_query('check_token')
+def _check_token():
+    return User.query.filter(User.token == 'token', User.token_expiration > datetime.utcnow())
+
+
+@known_query('users page')
+def _users_page():
+    return User.query.order_by(User.created_at, User.id).limit(10).offset(100)
+
+
+@known_query('posts of user')
+def _user_posts():
+    return Post.query.filter_by(user_id=1).order_by(Post.created_at.desc(), Post.id.desc()).limit(50)
+
+
+@known_query('posts page')
+def _posts_page():
+    return Post.query.order_by(Post.created_at, Post.id).limit(10).offset(100)
+
+
+@known_query('fisheries of user')
+def _user_fisheries():
+    return Fishery.query.filter_by(created_by=1)
+
+
+@known_query('fisheries by country')
+def _fisheries_by_country():
+    return Fishery.query.filter_by(country='Poland')
+
+
+@known_query('fisheries by country page')
+def _fisheries_by_country_page():
+    return Fishery.query.filter_by(country='Poland').order_by(Fishery.created_at, Fishery.id).limit(10)
+
+
+@known_query('fisheries page')
+def _fisheries_page():
+    return Fishery.query.order_by(Fishery.created_at, Fishery.id).limit(10)
+
+
+@known_query('fish of user')
+def _user_fish():
+    return Fish.query.filter_by(created_by=1)
+
+
+@known_query('fish by species')
+def _fish_by_species():
+    return Fish.query.filter_by(species='pike')
+
+
+@known_query('fish page')
+def _fish_page():
+    return Fish.query.order_by(Fish.created_at, Fish.id).limit(10)
+
+
+@known_query('anglers of fishery')
+def _fishery_anglers():
+    return users_fisheries.select().where(users_fisheries.c.fishery_id == 1)
+
+
+@known_query('fisheries of angler')
+def _angler_fisheries():
+    return users_fisheries.select().where(users_fisheries.c.user_id == 1)
+
+
+@known_query('expired tokens')
+def _expired_tokens():
+    return db.session.query(User.id).filter(User.token_expiration < datetime.utcnow()).limit(500)
+
+
+@known_query('posts to archive')
+def _posts_to_archive():
+    return db.session.query(Post.id).filter(Post.created_at < datetime.utcnow()) \
+        .order_by(Post.created_at, Post.id).limit(500)
+
+
+@known_query('archived posts of user')
+def _user_archived_posts():
+    return PostArchive.query.filter_by(user_id=1).order_by(PostArchive.created_at.desc()).limit(50)
+
+
+@known_query('changes since')
+def _changes_since():
+    return ChangeEvent.query.filter(ChangeEvent.id > 100, ChangeEvent.entity.in_(['user', 'fish'])) \
+        .order_by(ChangeEvent.id).limit(100)
+
+
+@known_query('changes to prune')
+def _changes_to_prune():
+    return db.session.query(ChangeEvent.id).filter(ChangeEvent.created_at < datetime.utcnow()) \
+        .order_by(ChangeEvent.created_at, ChangeEvent.id).limit(500)
+
+
+@known_query('sync page')
+def _sync_page():
+    return changed_statement('post', datetime(2020, 1, 1), datetime.utcnow(), (datetime(2020, 1, 2), 10), 500)
+
+
+@known_query('sync tombstones')
+def _sync_tombstones():
+    return db.session.query(ChangeEvent.id, ChangeEvent.entity, ChangeEvent.entity_id) \
+        .filter(ChangeEvent.id > 100, ChangeEvent.id <= 1000, ChangeEvent.op == 'delete',
+                ChangeEvent.entity.in_(['user', 'fish'])) \
+        .order_by(ChangeEvent.id).limit(500)
+
+
+@known_query('next job')
+def _next_job():
+    return db.session.query(Job.id).filter(Job.status == 'queued', Job.run_at <= datetime.utcnow()) \
+        .order_by(Job.run_at, Job.id).limit(10)
+
+
+def _statement(query):
+    return query.statement if hasattr(query, 'statement') else query
+
+
+def explain(query):
+    """
+    :param query: ORM Query or Core select
+    :return: list of plan lines (the 'detail' column of EXPLAIN QUERY PLAN)
+    """
+    compiled = _statement(query).compile()
+    rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {compiled}'), compiled.params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan):
+    """ Plan lines which read a whole table or sort without an index. """
+    return [line for line in plan
+            if (line.startswith('SCAN') and 'INDEX' not in line) or 'TEMP B-TREE' in line]
+
+
+def check():
+    """
+    :return: list of (name, plan, problems) for every known query
+    """
+    results = []
+    for name, builder in KNOWN_QUERIES:
+        plan = explain(builder())
+        results.append((name, plan, full_scans(plan)))
+    return results
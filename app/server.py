@@ -0,0 +1,283 @@
+"""
+Pre-forking production server.
+
+The master process loads the application once, binds the listening socket and
+forks SERVER_WORKERS workers which share the already imported code (copy-on-write).
+Workers are synchronous and keep-alive is deliberately not supported: every response
+carries 'Connection: close', an idle keep-alive client would block its worker.
+Put a proxy which keeps client connections open (nginx) in front of the server.
+A worker exits after SERVER_MAX_REQUESTS requests (+ jitter), the master starts
+a new one in its place.
+Workers publish the start of their current request in shared memory (SharedLoad,
+also read by the readiness check); the master kills a worker whose request made
+no progress for SERVER_TIMEOUT seconds.
+
+Signals of the master:
+    TERM, INT   graceful shutdown - workers finish their current connection
+    HUP         zero-downtime reload - a new master is started with the same socket,
+                it loads the new code, starts its workers and then stops the old master
+"""
+import gc
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import time
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from app import logs
+
+LISTEN_FD = 'ANG4US_LISTEN_FD'
+OLD_MASTER = 'ANG4US_OLD_MASTER'
+
+
+class SyncRequestHandler(WSGIRequestHandler):
+    """ One request per connection. The class attribute `timeout` limits reading the request. """
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # headers and body are separate writes - don't let Nagle hold the body back
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def send_header(self, keyword, value):
+        if keyword.lower() != 'connection':       # always 'close', see end_headers()
+            super().send_header(keyword, value)
+
+    def end_headers(self):
+        super().send_header('Connection', 'close')
+        self.close_connection = True
+        super().end_headers()
+
+    def log_request(self, code='-', size='-'):
+        """ No access log line per request - requests are logged by the application. """
+
+
+class SharedLoad:
+    """
+    Load of all workers, readable from every process: app.extensions['server_load'].
+    busy[slot] is the time.time() of the last progress of a worker's request, 0 when idle.
+    waiting[slot] is 1 while a worker holds a long poll or an event stream (app/api/changes.py).
+    """
+    def __init__(self, sock, workers):
+        self.sock = sock
+        self.workers = workers
+        self.busy = multiprocessing.RawArray('d', workers)
+        self.waiting = multiprocessing.RawArray('b', workers)
+        self.slot = None        # slot of this process, set in the workers
+
+    def in_flight(self):
+        return sum(1 for started in self.busy if started)
+
+    def backlog(self):
+        """ Connections waiting to be accepted, None where TCP_INFO is not available. """
+        if not hasattr(socket, 'TCP_INFO'):
+            return None
+        try:
+            info = self.sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 32)
+        except OSError:
+            return None
+        # struct tcp_info: 8 single bytes, then rto, ato, snd_mss, rcv_mss, unacked - for
+        # a listening socket 'unacked' is the length of the accept queue
+        return struct.unpack_from('8B5I', info)[12]
+
+
+class Arbiter:
+    def __init__(self, app, bind=None, workers=None, sock=None):
+        config = app.config
+        self.app = app
+        self.bind = bind or config['SERVER_BIND']
+        self.workers = workers or config['SERVER_WORKERS']
+        self.backlog = config['SERVER_BACKLOG']
+        self.max_requests = config['SERVER_MAX_REQUESTS']
+        self.max_requests_jitter = config['SERVER_MAX_REQUESTS_JITTER']
+        self.read_timeout = config['SERVER_READ_TIMEOUT']
+        self.timeout = config['SERVER_TIMEOUT']
+        self.graceful_timeout = config['SERVER_GRACEFUL_TIMEOUT']
+        self.sock = sock
+        self.children = {}      # pid -> slot in self.load.busy
+        self.load = None
+        self.running = True
+        self.reloading = False
+
+    def log(self, message, *args):
+        self.app.logger.info('[master %s] ' + message, os.getpid(), *args)
+
+    def listen(self):
+        """ Listening socket inherited from the previous master or a new one. """
+        if self.sock is not None:
+            return self.sock
+        if LISTEN_FD in os.environ:
+            fd = int(os.environ.pop(LISTEN_FD))
+            sock = socket.socket(fileno=fd)
+        else:
+            host, port = self.bind.rsplit(':', 1)
+            sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((host, int(port)))
+            sock.listen(self.backlog)
+        # workers must not block in accept() when another worker took the connection
+        sock.setblocking(False)
+        return sock
+
+    def run(self):
+        from app import db
+
+        self.sock = self.listen()
+        self.load = SharedLoad(self.sock, self.workers)
+        self.app.extensions['server_load'] = self.load
+        self.log('listening on %s:%s with %s workers', *self.sock.getsockname()[:2], self.workers)
+        with self.app.app_context():
+            # in-memory indexes etc. are built once here and shared by the workers
+            for warmup in self.app.extensions.get('warmup', []):
+                warmup()
+            db.session.remove()
+            db.engine.dispose()
+        # objects loaded so far are never freed - keep the gc from touching (copying) their pages
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGHUP, self._reload)
+
+        for _ in range(self.workers):
+            self.spawn()
+        if OLD_MASTER in os.environ:
+            os.kill(int(os.environ.pop(OLD_MASTER)), signal.SIGTERM)
+
+        while self.running:
+            self.reap()
+            self.kill_hung()
+            if self.reloading:
+                self.reloading = False
+                self.start_new_master()
+            while self.running and len(self.children) < self.workers:
+                self.spawn()
+            time.sleep(0.5)
+        self.shutdown()
+
+    def spawn(self):
+        limit = self.max_requests + random.randint(0, self.max_requests_jitter)
+        slot = min(set(range(self.workers)) - set(self.children.values()))
+        self.load.busy[slot] = 0
+        self.load.waiting[slot] = 0
+        pid = os.fork()
+        if pid:
+            self.children[pid] = slot
+            return pid
+        self.load.slot = slot
+        try:
+            code = Worker(self.app, self.sock, limit, self.read_timeout, self.load.busy, slot).run()
+        except BaseException:
+            self.app.logger.exception('worker %s crashed', os.getpid())
+            code = 1
+        # os._exit() skips atexit - write the queued log records first
+        logs.flush()
+        os._exit(code)
+
+    def reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if not pid:
+                return
+            slot = self.children.pop(pid, None)
+            if slot is not None:
+                self.load.busy[slot] = 0
+                self.load.waiting[slot] = 0
+
+    def kill_hung(self):
+        """ SIGKILL workers whose request made no progress for SERVER_TIMEOUT seconds. """
+        now = time.time()
+        for pid, slot in list(self.children.items()):
+            started = self.load.busy[slot]
+            if started and now - started > self.timeout:
+                self.app.logger.error('[master %s] worker %s timed out after %d seconds, killing it',
+                                      os.getpid(), pid, self.timeout)
+                self.load.busy[slot] = 0
+                _kill(pid, signal.SIGKILL)
+
+    def shutdown(self):
+        self.log('stopping %s workers', len(self.children))
+        for pid in list(self.children):
+            _kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            _kill(pid, signal.SIGKILL)
+        self.reap()
+
+    def start_new_master(self):
+        """ Re-run the current command with the listening socket; the new master stops this one. """
+        env = dict(os.environ, **{LISTEN_FD: str(self.sock.fileno()), OLD_MASTER: str(os.getpid())})
+        os.set_inheritable(self.sock.fileno(), True)
+        subprocess.Popen([sys.executable] + sys.argv, env=env, pass_fds=(self.sock.fileno(),))
+        self.log('reloading')
+
+    def _stop(self, signum, frame):
+        self.running = False
+
+    def _reload(self, signum, frame):
+        self.reloading = True
+
+
+class Worker:
+    def __init__(self, app, sock, max_requests, read_timeout, busy, slot):
+        self.app = app
+        self.sock = sock
+        self.max_requests = max_requests
+        self.read_timeout = read_timeout
+        self.busy = busy
+        self.slot = slot
+        self.handled = 0
+        self.running = True
+
+    def run(self):
+        from app import db
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        with self.app.app_context():
+            db.engine.dispose()
+
+        handler = type('Handler', (SyncRequestHandler,), {'timeout': self.read_timeout})
+        host, port = self.sock.getsockname()[:2]
+        server = BaseWSGIServer(host, port, self._serve, handler=handler, fd=self.sock.fileno())
+        server.timeout = 1.0
+        while self.running and self.handled < self.max_requests:
+            server.handle_request()
+            self.busy[self.slot] = 0
+        return 0
+
+    def _serve(self, environ, start_response):
+        self.handled += 1
+        self.busy[self.slot] = time.time()
+        response = self.app(environ, start_response)
+        try:
+            for chunk in response:
+                # a streaming response (server-sent events) is not hung while it sends something
+                self.busy[self.slot] = time.time()
+                yield chunk
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+
+    def _stop(self, signum, frame):
+        self.running = False
+
+
+def _kill(pid, sig):
+    try:
+        os.kill(pid, sig)
+    except ProcessLookupError:
+        pass
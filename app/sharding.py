@@ -0,0 +1,262 @@
+"""
+Horizontal sharding of Fishery rows (and their 'users_fisheries' links) by country.
+
+FISHERY_SHARDS maps a bind name from SQLALCHEMY_BINDS to the countries stored there,
+all other countries stay in the main database. Every shard has its own session;
+ids come from a global sequence in the main database, so a row keeps its id when
+the rebalance command moves it to another shard.
+Relationships between users and fisheries (User.fisheries, Fishery.author) only
+see the main database - use the router for fishery reads and writes.
+"""
+import threading
+from flask import current_app
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.sql import operators
+from app.models import Fishery, IdSequence, users_fisheries
+
+MAIN = None     # shard name of the main database
+
+
+class ShardRouter:
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._ids = iter(())
+        self.id_block = 100
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['shards'] = self
+        self.id_block = app.config.get('SHARD_ID_BLOCK', self.id_block)
+        app.teardown_appcontext(self._remove_sessions)
+
+    @property
+    def countries(self):
+        """ country (lower case) -> shard name """
+        return {country.lower(): name
+                for name, countries in current_app.config.get('FISHERY_SHARDS', {}).items()
+                for country in countries}
+
+    @property
+    def names(self):
+        return [MAIN] + sorted(current_app.config.get('FISHERY_SHARDS', {}))
+
+    @property
+    def enabled(self):
+        return bool(current_app.config.get('FISHERY_SHARDS'))
+
+    def shard_for(self, country):
+        return self.countries.get((country or '').lower(), MAIN)
+
+    def session(self, shard=MAIN):
+        from app import db
+
+        if shard is MAIN:
+            return db.session
+        key = (current_app._get_current_object(), shard)
+        with self._lock:
+            if key not in self._sessions:
+                engine = db.get_engine(current_app, bind=shard)
+                # 'binds' must be empty, otherwise the session sends every table to the main engine
+                self._sessions[key] = db.create_scoped_session(
+                    options={'bind': engine, 'binds': {}, 'info': {'shard': shard}})
+            return self._sessions[key]
+
+    def sessions(self):
+        return [(name, self.session(name)) for name in self.names]
+
+    def _remove_sessions(self, exc):
+        for (app, shard), session in list(self._sessions.items()):
+            if app is current_app._get_current_object():
+                session.remove()
+
+    # writes
+
+    def next_id(self):
+        """
+        Globally unique fishery id, taken from the main database in blocks of SHARD_ID_BLOCK.
+        A new block starts above the highest stored id - rows added while sharding was off
+        got their ids from the database, not from the sequence.
+        """
+        from app import db
+
+        with self._lock:
+            value = next(self._ids, None)
+            if value is None:
+                highest = self.highest_id()
+                with db.engine.begin() as connection:
+                    table = IdSequence.__table__
+                    start = case([(table.c.value < highest, highest)], else_=table.c.value)
+                    updated = connection.execute(table.update()
+                                                 .where(table.c.name == 'fishery')
+                                                 .values(value=start + self.id_block))
+                    if not updated.rowcount:
+                        raise RuntimeError("no 'fishery' id sequence - run 'flask shards init'")
+                    last = connection.execute(table.select().where(table.c.name == 'fishery')).first().value
+                self._ids = iter(range(last - self.id_block + 1, last + 1))
+                value = next(self._ids)
+            return value
+
+    def highest_id(self):
+        """ Highest fishery id in any shard, read outside the sessions (no autoflush of pending rows). """
+        from app import db
+
+        highest = 0
+        for name in self.names:
+            engine = db.engine if name is MAIN else db.get_engine(current_app, bind=name)
+            with engine.connect() as connection:
+                highest = max(highest, connection.execute(select([func.max(Fishery.id)])).scalar() or 0)
+        return highest
+
+    def add(self, fishery):
+        """ Add a new fishery to the session of its shard. :return: that session """
+        session = self.session(self.shard_for(fishery.country))
+        if self.enabled and fishery.id is None:
+            fishery.id = self.next_id()
+        session.add(fishery)
+        return session
+
+    def commit(self):
+        """
+        Commit every shard session, then the main one (counters of the authors live there).
+        Shards are committed one by one - there is no distributed transaction.
+        """
+        for name, session in reversed(self.sessions()):
+            session.commit()
+
+    # reads
+
+    def query(self, country):
+        """ Fishery query on the shard which stores the country. """
+        return self.session(self.shard_for(country)).query(Fishery).filter(Fishery.country == country)
+
+    def find(self, id):
+        """ :return: Fishery query of the shard holding the given id, or None """
+        for name, session in self.sessions():
+            if session.query(Fishery.id).filter(Fishery.id == id).first() is not None:
+                return session.query(Fishery)
+        return None
+
+    def all(self, order=None):
+        """ All fisheries from all shards, merged in the given order (default: created_at, id). """
+        order = order or Fishery.parse_sort(None)
+        items = []
+        for name, session in self.sessions():
+            items.extend(session.query(Fishery).order_by(*order).all())
+        return _merge(items, order)
+
+    def to_collection_dict(self, page, per_page, endpoint, order, fields=None, country=None, url_args=None):
+        """
+        Collection of fisheries from one shard (country given) or from all of them.
+        A cross-shard page reads the first page * per_page rows of every shard,
+        merges them and cuts the requested page.
+        """
+        if country is not None:
+            query = self.query(country).order_by(*order)
+            return Fishery.to_collection_dict(query, page, per_page, endpoint, fields=fields, url_args=url_args)
+
+        link_args = dict(url_args or {})
+        columns = Fishery.field_columns(fields) if fields else None
+        if fields:
+            link_args['fields'] = ','.join(fields)
+            # sort keys must be in the rows to merge them
+            columns += [c for c in _order_columns(order) if not any(c is column for column in columns)]
+
+        total = 0
+        items = []
+        for name, session in self.sessions():
+            query = session.query(*columns) if columns else session.query(Fishery)
+            total += session.query(func.count(Fishery.id)).scalar()
+            items.extend(query.order_by(*order).limit(page * per_page).all())
+        items = _merge(items, order)[(page - 1) * per_page:page * per_page]
+
+        if fields:
+            items = [Fishery.row_to_dict(fields, row) for row in items]
+        else:
+            items = [item.to_dict() for item in items]
+        return Fishery.collection_dict(items, page, per_page, total, endpoint, link_args)
+
+    # maintenance
+
+    def create_all(self):
+        """ Create the sharded tables in every shard and the id sequence in the main database. """
+        from app import db
+
+        for name in self.names[1:]:
+            engine = db.get_engine(current_app, bind=name)
+            Fishery.__table__.create(bind=engine, checkfirst=True)
+            users_fisheries.create(bind=engine, checkfirst=True)
+        IdSequence.__table__.create(bind=db.engine, checkfirst=True)
+        # also when the sequence exists: ids given while sharding was off are not in it
+        highest = self.highest_id()
+        sequence = IdSequence.query.get('fishery')
+        if sequence is None:
+            db.session.add(IdSequence(name='fishery', value=highest))
+        elif sequence.value < highest:
+            sequence.value = highest
+        db.session.commit()
+
+    def rebalance(self, batch_size=500):
+        """
+        Move fisheries whose country belongs to another shard (after FISHERY_SHARDS changed).
+        Each batch is written to the target shard first and removed from the source afterwards,
+        so an interrupted run can be repeated.
+        :return: number of moved fisheries per (source, target)
+        """
+        moved = {}
+        table = Fishery.__table__
+        for source, session in self.sessions():
+            while True:
+                batch = session.execute(table.select()
+                                        .where(self._misplaced(source))
+                                        .order_by(table.c.id)
+                                        .limit(batch_size)).fetchall()
+                if not batch:
+                    break
+                by_target = {}
+                for row in batch:
+                    by_target.setdefault(self.shard_for(row.country), []).append(dict(row))
+                for target, rows in by_target.items():
+                    ids = [row['id'] for row in rows]
+                    links = [dict(link) for link in session.execute(
+                        users_fisheries.select().where(users_fisheries.c.fishery_id.in_(ids))).fetchall()]
+                    target_session = self.session(target)
+                    target_session.execute(users_fisheries.delete().where(users_fisheries.c.fishery_id.in_(ids)))
+                    target_session.execute(table.delete().where(table.c.id.in_(ids)))
+                    target_session.execute(table.insert(), rows)
+                    if links:
+                        target_session.execute(users_fisheries.insert(), links)
+                    target_session.commit()
+
+                    session.execute(users_fisheries.delete().where(users_fisheries.c.fishery_id.in_(ids)))
+                    session.execute(table.delete().where(table.c.id.in_(ids)))
+                    session.commit()
+                    moved[(source, target)] = moved.get((source, target), 0) + len(ids)
+        return moved
+
+    def _misplaced(self, shard):
+        """ WHERE clause matching fisheries which don't belong to the given shard. """
+        country = Fishery.__table__.c.country
+        mapping = self.countries
+        if shard is MAIN:
+            return func.lower(country).in_(list(mapping))
+        own = [name for name, target in mapping.items() if target == shard]
+        return or_(country.is_(None), ~func.lower(country).in_(own))
+
+
+def _order_columns(order):
+    """ Columns of ORDER BY expressions (plain columns or column.desc()). """
+    return [getattr(expression, 'element', expression) for expression in order]
+
+
+def _merge(items, order):
+    """ Sort items (ORM objects or rows) from several shards by ORDER BY expressions. """
+    for expression in reversed(order):
+        name = getattr(expression, 'element', expression).name
+        descending = getattr(expression, 'modifier', None) is operators.desc_op
+        items.sort(key=lambda item: (getattr(item, name) is None, getattr(item, name)), reverse=descending)
+    return items
+
+
+shards = ShardRouter()
@@ -0,0 +1,220 @@
+"""
+Autocomplete of fish species and fishery names from memory.
+
+Names of every kind are kept in a sorted list of (folded name, id); a prefix lookup is
+a bisect plus a short scan, no database query. Names are folded (case, accents) so
+'wegorz' finds 'Węgorz'. The index is loaded once (before the server forks, see
+app/server.py) and follows inserts, renames and deletes of all processes through the
+change outbox (app/changes.py). The outbox is read every SUGGEST_REFRESH_INTERVAL
+seconds by a background thread of each process, started by its first lookup - never
+by the request itself. Entries over the SUGGEST_MAX_MEMORY budget are left out.
+"""
+import heapq
+import os
+import sys
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from itertools import islice
+from flask import current_app
+
+KINDS = {
+    'fish': 'species',
+    'fishery': 'reservoir_name'
+}
+
+# list slot + tuple + dict entry, roughly, on top of the two strings
+_ENTRY_OVERHEAD = 8 + 72 + 100
+
+
+def fold(name):
+    """ Lower case without accents: 'Węgorz' -> 'wegorz'. """
+    decomposed = unicodedata.normalize('NFKD', name)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+class SuggestIndex:
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.RLock()    # one load or refresh at a time
+        self._thread_pid = None     # process whose refresh thread is running
+        self._keys = {kind: [] for kind in KINDS}     # kind -> sorted (folded name, id)
+        self._names = {}        # (kind, id) -> (folded name, name)
+        self.loaded = False
+        self.last_event_id = 0
+        self.memory = 0
+        self.max_memory = 64 * 1024 * 1024
+        self.refresh_interval = 1.0
+        self.truncated = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_memory = app.config.get('SUGGEST_MAX_MEMORY', self.max_memory)
+        self.refresh_interval = app.config.get('SUGGEST_REFRESH_INTERVAL', self.refresh_interval)
+        app.extensions['suggest'] = self
+        app.extensions.setdefault('warmup', []).append(self.load)
+
+    def __len__(self):
+        return len(self._names)
+
+    # changes
+
+    def add(self, kind, id, name):
+        """ Add or rename an entry. :return: False when the memory budget is used up """
+        with self._lock:
+            self._remove((kind, id))
+            if not name:
+                return True
+            folded = fold(name)
+            size = sys.getsizeof(folded) + sys.getsizeof(name) + _ENTRY_OVERHEAD
+            if self.memory + size > self.max_memory:
+                if not self.truncated:
+                    self.truncated = True
+                    current_app.logger.warning('suggest index: memory budget of %d bytes used up at %d names',
+                                               self.max_memory, len(self._names))
+                return False
+            insort(self._keys[kind], (folded, id))
+            self._names[(kind, id)] = (folded, name)
+            self.memory += size
+            return True
+
+    def remove(self, kind, id):
+        with self._lock:
+            self._remove((kind, id))
+
+    def _remove(self, key):
+        """ Call with the lock held. """
+        entry = self._names.pop(key, None)
+        if entry is None:
+            return
+        folded, name = entry
+        kind, id = key
+        keys = self._keys[kind]
+        i = bisect_left(keys, (folded, id))
+        if i < len(keys) and keys[i] == (folded, id):
+            del keys[i]
+        self.memory -= sys.getsizeof(folded) + sys.getsizeof(name) + _ENTRY_OVERHEAD
+
+    def clear(self):
+        with self._lock:
+            self._keys = {kind: [] for kind in KINDS}
+            self._names = {}
+            self.memory = 0
+            self.truncated = False
+            self.loaded = False
+
+    # database
+
+    def load(self):
+        """ (Re)build the index from the database. """
+        from app import changes, db
+        from app.models import Fish, Fishery
+        from app.sharding import shards
+
+        with self._refresh_lock:
+            # events written while loading are applied afterwards - applying one twice is harmless
+            last_event_id = changes.last_id()
+            entries = [('fish', id, name)
+                       for id, name in db.session.query(Fish.id, Fish.species).yield_per(1000)]
+            for _, session in shards.sessions():
+                entries.extend(('fishery', id, name)
+                               for id, name in session.query(Fishery.id, Fishery.reservoir_name).yield_per(1000))
+            self.build(entries)
+            self.last_event_id = last_event_id
+
+    def build(self, entries):
+        """ Replace the index with (kind, id, name) entries - one sort instead of an insort per name. """
+        keys = {kind: [] for kind in KINDS}
+        names = {}
+        memory = 0
+        truncated = False
+        for kind, id, name in entries:
+            if not name:
+                continue
+            folded = fold(name)
+            size = sys.getsizeof(folded) + sys.getsizeof(name) + _ENTRY_OVERHEAD
+            if memory + size > self.max_memory:
+                truncated = True
+                break
+            keys[kind].append((folded, id))
+            names[(kind, id)] = (folded, name)
+            memory += size
+        for kind_keys in keys.values():
+            kind_keys.sort()
+        with self._lock:
+            self._keys, self._names, self.memory, self.truncated = keys, names, memory, truncated
+            self.loaded = True
+        if truncated:
+            current_app.logger.warning('suggest index: memory budget of %d bytes used up at %d names',
+                                       self.max_memory, len(names))
+
+    def refresh(self):
+        """ Load the index or apply the new change events. """
+        from app import changes
+
+        with self._refresh_lock:
+            if not self.loaded:
+                self.load()
+                return
+            while True:
+                events = changes.read(self.last_event_id, 1000, list(KINDS))
+                for event in events:
+                    self.apply(event)
+                    self.last_event_id = event.id
+                if len(events) < 1000:
+                    break
+
+    def start(self, app):
+        """ Start the refresh thread of this process, unless it runs already (threads don't survive a fork). """
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, args=(app,), name='suggest-refresh', daemon=True).start()
+
+    def _run(self, app):
+        from app import db
+
+        while True:
+            with app.app_context():
+                try:
+                    self.refresh()
+                except Exception:
+                    app.logger.exception('suggest index: refresh failed')
+                finally:
+                    db.session.remove()
+            time.sleep(self.refresh_interval)
+
+    def apply(self, event):
+        if event.op == 'delete':
+            self.remove(event.entity, event.entity_id)
+            return
+        change = event.to_dict()['changes'] or {}
+        field = KINDS[event.entity]
+        if field in change:
+            self.add(event.entity, event.entity_id, change[field]['new'])
+
+    # lookups
+
+    def suggest(self, prefix, limit=10, kind=None):
+        """
+        :return: list of (name, kind, id), ordered by folded name
+        """
+        prefix = fold(prefix)
+        if not prefix:
+            return []
+        kinds = [kind] if kind is not None else list(KINDS)
+        with self._lock:
+            matches = heapq.merge(*[self._scan(name, prefix) for name in kinds])
+            return [(self._names[(entry_kind, id)][1], entry_kind, id)
+                    for folded, id, entry_kind in islice(matches, limit)]
+
+    def _scan(self, kind, prefix):
+        """ (folded name, id, kind) of one kind starting with the prefix, in order. """
+        keys = self._keys[kind]
+        i = bisect_left(keys, (prefix,))
+        while i < len(keys) and keys[i][0].startswith(prefix):
+            yield keys[i][0], keys[i][1], kind
+            i += 1
@@ -0,0 +1,223 @@
+"""
+Delta sync for offline clients.
+
+Synced rows carry modified_at: a before_flush listener stamps it on inserts and on
+every net change of a published column (app/changes.py), the counters stamp it when
+they change. A sync returns the rows with since < modified_at <= until, table by table
+in (modified_at, id) order, followed by tombstones - the delete events of the change
+outbox between two event ids. Both bounds are fixed when a sync starts and travel in
+an opaque cursor together with the position reached, so an interrupted sync goes on
+with the next page. The cursor of the last page is the client's watermark for the
+next sync.
+
+`until` lags SYNC_SETTLE_SECONDS behind the clock: modified_at is stamped at flush
+time, a transaction committing later than that would be missed by a sync which
+started in between.
+"""
+import base64
+import binascii
+import heapq
+import json
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, event, inspect, or_, select
+from sqlalchemy.orm import Session
+from app import db
+from app.changes import PUBLISHED, published_columns
+from app.models import ChangeEvent, User, Post, Fishery, Fish
+from app.sharding import shards
+
+# entity -> (model, columns sent to clients), parents before children
+SYNCED = {
+    'user': (User, ['id', 'created_at', 'modified_at', 'username', 'about_me', 'post_count', 'fishery_count']),
+    'fishery': (Fishery, ['id', 'created_at', 'modified_at', 'reservoir_name', 'country', 'place',
+                          'longitude', 'latitude', 'created_by', 'user_count']),
+    'fish': (Fish, ['id', 'created_at', 'modified_at', 'species', 'description', 'photos', 'created_by']),
+    'post': (Post, ['id', 'created_at', 'modified_at', 'body', 'user_id'])
+}
+ENTITIES = list(SYNCED)
+
+
+class WatermarkExpired(Exception):
+    """ The tombstones after the client's watermark were pruned - it has to sync from scratch. """
+
+
+def _before_flush(session, flush_context, instances):
+    now = datetime.utcnow()
+    for target in session.new:
+        if type(target) not in PUBLISHED:
+            continue
+        # the column default of created_at would run later, at INSERT time
+        if target.created_at is None:
+            target.created_at = now
+        if target.modified_at is None:
+            target.modified_at = target.created_at
+    for target in session.dirty:
+        if type(target) not in PUBLISHED:
+            continue
+        state = inspect(target)
+        if state.attrs.modified_at.history.has_changes():
+            continue
+        # dirty also means a relationship or a volatile field changed, or a value was set to itself
+        if any(state.attrs[column.key].history.has_changes() for column in published_columns(state.mapper)):
+            target.modified_at = now
+
+
+# Session class: shard sessions (app/sharding.py) are stamped as well
+event.listen(Session, 'before_flush', _before_flush)
+
+
+# cursor
+
+def encode_cursor(state):
+    data = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _valid_id(value):
+    if type(value) is not int or value < 0:
+        raise ValueError(value)
+    return value
+
+
+def decode_cursor(cursor):
+    """
+    :return: a watermark {'since', 'events'} or the state of a sync in progress, see _start()
+    Raises ValueError for anything else - a tampered cursor must not reach the queries.
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        state = json.loads(data.decode('utf-8'))
+        if state['since'] is not None:
+            datetime.fromisoformat(state['since'])
+        _valid_id(state['events'])
+        if 'until' in state:
+            datetime.fromisoformat(state['until'])
+            _valid_id(state['events_until'])
+            if not 0 <= _valid_id(state['position']) <= len(ENTITIES):
+                raise ValueError(state['position'])
+            if state['after'] is not None:
+                modified_at, id = state['after']
+                datetime.fromisoformat(modified_at)
+                _valid_id(id)
+    except (binascii.Error, ValueError, TypeError, KeyError, IndexError, AttributeError, UnicodeDecodeError):
+        raise ValueError('invalid cursor')
+    return state
+
+
+def _start(state):
+    """
+    Fix the bounds of a new sync.
+    :param state: cursor of a finished sync (the watermark), None for a full sync
+    """
+    config = current_app.config
+    now = datetime.utcnow()
+    if state is not None and state['since'] is not None:
+        oldest = now - timedelta(days=config['CHANGES_RETENTION_DAYS'])
+        if datetime.fromisoformat(state['since']) < oldest:
+            raise WatermarkExpired()
+    return {
+        'since': state['since'] if state else None,
+        'until': (now - timedelta(seconds=config['SYNC_SETTLE_SECONDS'])).isoformat(),
+        # a full sync needs no tombstones, rows deleted before it are not in it
+        'events': state['events'] if state else _last_event_id(),
+        'events_until': _last_event_id(),
+        'position': 0,
+        'after': None
+    }
+
+
+def _last_event_id():
+    return db.session.query(db.func.max(ChangeEvent.id)).scalar() or 0
+
+
+# reads
+
+def changed_statement(entity, since, until, after, limit):
+    """ Rows of one entity with since < modified_at <= until, after the (modified_at, id) position. """
+    model, fields = SYNCED[entity]
+    table = model.__table__
+    modified_at, id = table.c.modified_at, table.c.id
+    statement = select([table.c[field] for field in fields]).where(modified_at <= until)
+    if since is not None:
+        statement = statement.where(modified_at > since)
+    if after is not None:
+        statement = statement.where(or_(modified_at > after[0], and_(modified_at == after[0], id > after[1])))
+    return statement.order_by(modified_at, id).limit(limit)
+
+
+def _rows(entity, state, limit):
+    since = datetime.fromisoformat(state['since']) if state['since'] else None
+    until = datetime.fromisoformat(state['until'])
+    after = (datetime.fromisoformat(state['after'][0]), state['after'][1]) if state['after'] else None
+    statement = changed_statement(entity, since, until, after, limit)
+    if entity != 'fishery':
+        return db.session.execute(statement).fetchall()
+    # every shard is read in the same order and merged - ids are unique across shards
+    position = SYNCED[entity][1].index('modified_at')
+    parts = [session.execute(statement).fetchall() for _, session in shards.sessions()]
+    return list(heapq.merge(*parts, key=lambda row: (row[position], row[0])))[:limit]
+
+
+def _tombstones(state, limit):
+    """
+    :return: (entity -> deleted ids, id of the last event read or None, number of events read)
+    """
+    events = db.session.query(ChangeEvent.id, ChangeEvent.entity, ChangeEvent.entity_id) \
+        .filter(ChangeEvent.id > state['events'], ChangeEvent.id <= state['events_until'],
+                ChangeEvent.op == 'delete', ChangeEvent.entity.in_(ENTITIES)) \
+        .order_by(ChangeEvent.id).limit(limit).all()
+    deleted = {}
+    for _, entity, entity_id in events:
+        deleted.setdefault(entity, []).append(entity_id)
+    # SQLite reuses the highest id after a delete - don't delete the new row on the client
+    for entity, ids in deleted.items():
+        model = SYNCED[entity][0]
+        sessions = [session for _, session in shards.sessions()] if entity == 'fishery' else [db.session]
+        existing = set()
+        for session in sessions:
+            existing.update(id for (id,) in session.query(model.id).filter(model.id.in_(ids)))
+        deleted[entity] = [id for id in ids if id not in existing]
+    deleted = {entity: ids for entity, ids in deleted.items() if ids}
+    return deleted, events[-1][0] if events else None, len(events)
+
+
+def page(cursor=None, limit=500):
+    """
+    One page of a sync.
+    Raises ValueError for a malformed cursor and WatermarkExpired for a watermark older than the outbox.
+    :param cursor: cursor of the previous page, the watermark of the last sync, or None for a full sync
+    :return: {'changes': {entity: {'fields': [...], 'rows': [[...], ...]}}, 'deleted': {entity: [id, ...]},
+              'cursor': ..., 'more': bool}
+    """
+    state = decode_cursor(cursor) if cursor else None
+    if state is None or 'until' not in state:
+        state = _start(state)
+
+    changes = {}
+    remaining = limit
+    while remaining and state['position'] < len(ENTITIES):
+        entity = ENTITIES[state['position']]
+        rows = _rows(entity, state, remaining)
+        if rows:
+            fields = SYNCED[entity][1]
+            changes[entity] = {'fields': fields, 'rows': [list(row) for row in rows]}
+            last = rows[-1]
+            state['after'] = [last[fields.index('modified_at')].isoformat(), last[0]]
+            remaining -= len(rows)
+        if remaining:
+            state['position'] += 1
+            state['after'] = None
+
+    deleted = {}
+    if remaining:
+        deleted, last_event, count = _tombstones(state, remaining)
+        if last_event is not None:
+            state['events'] = last_event
+        remaining = remaining if count < remaining else 0
+
+    more = not remaining
+    if not more:
+        # the watermark for the next sync
+        state = {'since': state['until'], 'events': state['events_until']}
+    return {'changes': changes, 'deleted': deleted, 'cursor': encode_cursor(state), 'more': more}
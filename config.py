@@ -5,7 +5,112 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, '.env'))
 
 
+def parse_shards(value):
+    """ 'north:Sweden,Norway;central:Poland,Germany' -> {'north': ['Sweden', 'Norway'], ...} """
+    shards = {}
+    for item in filter(None, (value or '').split(';')):
+        name, countries = item.split(':', 1)
+        shards[name.strip()] = [country.strip() for country in countries.split(',') if country.strip()]
+    return shards
+
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'secret-key-for-ang4us'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # background job queue (app/jobs.py)
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or os.cpu_count() or 1)
+    JOB_MAX_ATTEMPTS = 5
+    JOB_BACKOFF_BASE = 2.0          # seconds, doubled after every failed attempt
+    JOB_BACKOFF_MAX = 600.0
+    JOB_POLL_INTERVAL = 1.0
+    JOB_LOCK_TIMEOUT = 300          # running jobs older than this are re-queued
+
+    # photo uploads (app/photos)
+    PHOTOS_DIR = os.environ.get('PHOTOS_DIR') or os.path.join(basedir, 'photos')
+    PHOTOS_CACHE_MAX_AGE = 31536000
+    THUMBNAIL_SIZE = (320, 320)
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+
+    # API responses (app/jsonprovider.py)
+    JSONIFY_PRETTYPRINT_REGULAR = False
+    JSON_COMPRESS_MIN_SIZE = 1024   # bytes, smaller responses are sent uncompressed
+    JSON_COMPRESS_LEVEL = 6
+
+    # user identity cache (app/identity.py); other processes see profile changes after the TTL
+    IDENTITY_CACHE_TTL = 5.0        # seconds
+    IDENTITY_CACHE_SIZE = 1024      # users per process
+
+    # Fishery sharding by country (app/sharding.py); every shard is a SQLALCHEMY_BINDS entry,
+    # SHARD_<NAME>_URL or a local SQLite file shard_<name>.db
+    FISHERY_SHARDS = parse_shards(os.environ.get('FISHERY_SHARDS'))
+    SQLALCHEMY_BINDS = {
+        name: os.environ.get(f'SHARD_{name.upper()}_URL') or 'sqlite:///' + os.path.join(basedir, f'shard_{name}.db')
+        for name in FISHERY_SHARDS
+    }
+    SHARD_ID_BLOCK = 100            # fishery ids reserved at once by every process
+
+    # production server (app/server.py, `flask serve`)
+    SERVER_BIND = os.environ.get('SERVER_BIND') or '127.0.0.1:8000'
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS') or os.cpu_count() or 1)
+    SERVER_BACKLOG = 2048
+    SERVER_MAX_REQUESTS = 10000     # a worker is replaced after this many requests...
+    SERVER_MAX_REQUESTS_JITTER = 1000   # ...plus a random part, so workers don't restart together
+    SERVER_READ_TIMEOUT = 5         # seconds a client gets to send its request
+    SERVER_TIMEOUT = 30             # seconds a request may run without progress before its worker is killed
+    SERVER_GRACEFUL_TIMEOUT = 30    # seconds workers get to finish on shutdown
+
+    # application log (app/logs.py); JSON lines written by a background thread
+    LOG_DIR = os.environ.get('LOG_DIR') or 'logs'
+    LOG_FILE = 'ang4us.log'
+    LOG_MAX_BYTES = 50 * 1024 * 1024
+    LOG_ROTATE_INTERVAL = 86400     # seconds, a new file is started every day as well
+    LOG_BACKUP_COUNT = 10
+    LOG_QUEUE_SIZE = 10000          # records waiting for the writer, more are dropped
+    LOG_BATCH_SIZE = 500
+    LOG_FLUSH_INTERVAL = 1.0        # seconds
+    LOG_ACCESS_SAMPLE_RATE = float(os.environ.get('LOG_ACCESS_SAMPLE_RATE') or 1.0)
+    LOG_SLOW_REQUEST = 1.0          # seconds, slow and failed requests are always logged
+
+    # health checks (app/health); /readyz answers 503 above these limits
+    HEALTH_PROBE_TTL = 1.0          # seconds a database probe result is reused
+    # default: all workers busy except the one answering the probe (app/health/monitor.py)
+    READY_MAX_IN_FLIGHT = int(os.environ['READY_MAX_IN_FLIGHT']) if os.environ.get('READY_MAX_IN_FLIGHT') else None
+    READY_MAX_BACKLOG = int(os.environ.get('READY_MAX_BACKLOG') or 16)    # connections waiting for a worker
+    READY_MAX_POOL_WAIT = 0.5       # seconds to check out a database connection
+
+    # archival and cleanup (app/archive.py, job 'maintenance.run')
+    POST_RETENTION_DAYS = int(os.environ.get('POST_RETENTION_DAYS') or 365)
+    MAINTENANCE_BATCH_SIZE = 500    # rows per transaction
+    MAINTENANCE_PAUSE = 1.0         # seconds between batches
+    MAINTENANCE_BATCHES_PER_JOB = 20
+    MAINTENANCE_INTERVAL = 3600     # seconds until the next run when nothing was left
+
+    # change data capture (app/changes.py, /api/changes)
+    CHANGES_BATCH_SIZE = 100        # events per response or server-sent event
+    CHANGES_MAX_BATCH = 1000
+    CHANGES_MAX_WAIT = 10           # seconds a long poll waits for new events
+    CHANGES_POLL_INTERVAL = 0.5     # seconds between outbox reads while waiting
+    CHANGES_STREAM_TIMEOUT = 60     # seconds before an event stream is closed
+    # workers which may hold a long poll or an event stream, default: half of them (app/api/changes.py)
+    CHANGES_MAX_WAITING = int(os.environ['CHANGES_MAX_WAITING']) if os.environ.get('CHANGES_MAX_WAITING') else None
+    CHANGES_RETENTION_DAYS = 30     # older events are pruned by the maintenance job
+
+    # template fragment cache (app/fragments.py, {% cache %} tag)
+    FRAGMENT_CACHE_ENABLED = True
+    FRAGMENT_CACHE_SIZE = 2048      # fragments per process
+    FRAGMENT_CACHE_DIR = os.environ.get('FRAGMENT_CACHE_DIR')     # shared tier, off when not set
+    FRAGMENT_CACHE_TTL = 3600       # seconds a shared fragment is used
+    PRELOAD_TEMPLATES = True
+    POSTS_PER_PAGE = 50
+
+    # name autocomplete (app/suggest.py, /api/fish/suggest)
+    SUGGEST_MAX_MEMORY = 64 * 1024 * 1024   # bytes per process (~350 per name), more names are left out
+    SUGGEST_REFRESH_INTERVAL = 1.0  # seconds between reads of the change outbox
+    SUGGEST_MAX_LIMIT = 50
+
+    # delta sync for offline clients (app/sync.py, /api/sync)
+    SYNC_BATCH_SIZE = 500           # rows and tombstones per page
+    SYNC_MAX_BATCH = 5000
+    SYNC_SETTLE_SECONDS = 5         # longer than any write transaction, see app/sync.py
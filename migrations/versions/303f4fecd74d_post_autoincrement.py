@@ -0,0 +1,45 @@
+"""post autoincrement
+
+Revision ID: 303f4fecd74d
+Revises: ac130b188cb7
+Create Date: 2026-10-19 19:46:34.644412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '303f4fecd74d'
+down_revision = 'ac130b188cb7'
+branch_labels = None
+depends_on = None
+
+
+POST_ALL_VIEW = ('CREATE VIEW post_all AS '
+                 'SELECT id, created_at, modified_at, body, user_id FROM post '
+                 'UNION ALL SELECT id, created_at, modified_at, body, user_id FROM post_archive')
+
+
+def _recreate_post(autoincrement):
+    """ SQLite can't add AUTOINCREMENT to a table - copy it into a new one (the view is in the way). """
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute('DROP VIEW post_all')
+    with op.batch_alter_table('post', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': autoincrement}) as batch_op:
+        pass
+    op.execute(POST_ALL_VIEW)
+
+
+def upgrade():
+    _recreate_post(True)
+    if op.get_bind().dialect.name == 'sqlite':
+        # new posts start above every id ever used, archived ones included
+        op.execute("DELETE FROM sqlite_sequence WHERE name = 'post'")
+        op.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'post', MAX(COALESCE(MAX(id), 0), "
+                   "(SELECT COALESCE(MAX(id), 0) FROM post_archive)) FROM post")
+
+
+def downgrade():
+    _recreate_post(False)
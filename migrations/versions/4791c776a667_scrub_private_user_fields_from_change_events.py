@@ -0,0 +1,43 @@
+"""scrub private user fields from change events
+
+Revision ID: 4791c776a667
+Revises: 303f4fecd74d
+Create Date: 2026-10-19 19:47:30.059818
+
+"""
+import json
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4791c776a667'
+down_revision = '303f4fecd74d'
+branch_labels = None
+depends_on = None
+
+PRIVATE_FIELDS = ('email', 'email_confirmed')
+
+
+def upgrade():
+    # events written before User._private_fields existed published them
+    connection = op.get_bind()
+    events = connection.execute(sa.text(
+        "SELECT id, op, changes FROM change_event WHERE entity = 'user' AND changes IS NOT NULL")).fetchall()
+    for id, event_op, changes in events:
+        data = json.loads(changes)
+        if not any(field in data for field in PRIVATE_FIELDS):
+            continue
+        for field in PRIVATE_FIELDS:
+            data.pop(field, None)
+        if not data and event_op == 'update':
+            # the update changed nothing but private fields - _after_update would not have recorded it
+            connection.execute(sa.text('DELETE FROM change_event WHERE id = :id'), {'id': id})
+            continue
+        connection.execute(sa.text('UPDATE change_event SET changes = :changes WHERE id = :id'),
+                           {'changes': json.dumps(data, separators=(',', ':')), 'id': id})
+
+
+def downgrade():
+    # deliberately a no-op: the scrubbed values are gone, and publishing them again is what this fixed
+    pass